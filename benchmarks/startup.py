@@ -0,0 +1,204 @@
+"""
+Startup benchmarks for pydoro
+
+Measures, in milliseconds:
+* cold time to first frame  - spawning a fresh interpreter until the first `_draw()`
+* warm time to first frame  - `Configuration()` + `UserInterface()` + `_draw()`
+                              again in an interpreter that has everything imported
+* import time per module    - cumulative `python -X importtime` figures
+* `pydoro --version` and `pydoro --audio-check` wall-clock latency
+
+Usage:
+    python benchmarks/startup.py [--repeat N] [--output results.json]
+                                 [--budgets benchmarks/budgets.json] [--tolerance 0.2]
+
+Results are printed as JSON. With --budgets, every metric named in the budget
+file is compared against its limit (plus tolerance) and the script exits
+with status 1 if any of them is over budget. Budgets are absolute numbers,
+keep them generous enough for the slowest machine they are checked on.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BUDGETS = os.path.join(ROOT, "benchmarks", "budgets.json")
+
+# Modules reported by the import time benchmark
+IMPORT_MODULES = [
+    "pydoro.cli",
+    "pydoro.pydoro_tui",
+    "pydoro.pydoro_core.config",
+    "pydoro.pydoro_core.tomato",
+    "pydoro.pydoro_core.sound",
+    "pydoro.pydoro_core.util",
+    "prompt_toolkit",
+]
+
+FIRST_FRAME = """
+import sys, time
+sys.argv = ["pydoro", "--no-sound"]
+from prompt_toolkit.application import create_app_session
+from prompt_toolkit.input import create_pipe_input
+from prompt_toolkit.output import DummyOutput
+from pydoro.pydoro_core.config import Configuration
+from pydoro.pydoro_tui import UserInterface
+
+
+def first_frame():
+    with create_pipe_input() as inp:
+        with create_app_session(input=inp, output=DummyOutput()):
+            UserInterface(Configuration())._draw()
+
+
+first_frame()
+print("cold", time.time())
+for _ in range({warm_repeat}):
+    started = time.perf_counter()
+    first_frame()
+    print("warm", (time.perf_counter() - started) * 1000)
+"""
+
+
+def _environment(home):
+    env = dict(os.environ)
+    env["HOME"] = home
+    env["XDG_CACHE_HOME"] = os.path.join(home, ".cache")
+    env["PYDORO_CONFIG_FILE"] = os.path.join(home, "pydoro.ini")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+    return env
+
+
+def _wall_clock(args, env):
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable] + args,
+        env=env,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    return (time.perf_counter() - started) * 1000, result
+
+
+def bench_first_frame(env, repeat):
+    cold, warm = [], []
+    for _ in range(repeat):
+        # WHY wall clock: the cold figure spans two processes
+        spawned = time.time()
+        _, result = _wall_clock(["-c", FIRST_FRAME.format(warm_repeat=repeat)], env)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr)
+        for line in result.stdout.splitlines():
+            kind, value = line.split()
+            if kind == "cold":
+                cold.append((float(value) - spawned) * 1000)
+            else:
+                warm.append(float(value))
+    return {
+        "first_frame_cold_ms": statistics.median(cold),
+        "first_frame_warm_ms": statistics.median(warm),
+    }
+
+
+def bench_imports(env, repeat):
+    samples = {module: [] for module in IMPORT_MODULES}
+    for _ in range(repeat):
+        _, result = _wall_clock(
+            ["-X", "importtime", "-c", "import pydoro.cli, pydoro.pydoro_tui"], env
+        )
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            _, cumulative, module = line.split("|")
+            module = module.strip()
+            if module in samples and cumulative.strip().isdigit():
+                samples[module].append(int(cumulative) / 1000)
+    return {
+        "import_ms." + module: statistics.median(values)
+        for module, values in samples.items()
+        if values
+    }
+
+
+def bench_commands(env, repeat):
+    results = {}
+    for name, args in [("version", ["--version"]), ("audio_check", ["--audio-check"])]:
+        timings = []
+        for _ in range(repeat):
+            elapsed, result = _wall_clock(["-m", "pydoro.cli"] + args, env)
+            timings.append(elapsed)
+        results[name + "_ms"] = statistics.median(timings)
+        results[name + "_ok"] = result.returncode == 0
+    return results
+
+
+def check_budgets(results, budgets, tolerance):
+    failures = []
+    for metric, limit in sorted(budgets.items()):
+        value = results.get(metric)
+        if value is None:
+            continue
+        if value > limit * (1 + tolerance):
+            failures.append(
+                "{}: {:.1f}ms exceeds budget {:.1f}ms (+{:.0%})".format(
+                    metric, value, limit, tolerance
+                )
+            )
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        "startup", description="pydoro startup benchmarks"
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="samples per metric")
+    parser.add_argument("--output", metavar="path", help="also write results here")
+    parser.add_argument(
+        "--budgets",
+        metavar="path",
+        nargs="?",
+        const=DEFAULT_BUDGETS,
+        help="fail if a metric exceeds its budget (default: %(const)s)",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="allowed fraction over budget before failing",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        env = _environment(home)
+        # WHY: the first run creates the default ini, keep it out of the numbers
+        _wall_clock(["-m", "pydoro.cli", "--version"], env)
+        results = {"python": sys.version.split()[0], "repeat": args.repeat}
+        results.update(bench_first_frame(env, args.repeat))
+        results.update(bench_imports(env, args.repeat))
+        results.update(bench_commands(env, args.repeat))
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+    if args.budgets:
+        with open(args.budgets) as f:
+            failures = check_budgets(results, json.load(f), args.tolerance)
+        for failure in failures:
+            print(failure, file=sys.stderr)
+        if failures:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Per-timer benchmarks for pydoro's state machine
+
+Measures:
+* memory per timer      - bytes traced by tracemalloc per idle, running and
+                          paused Tomato, as the daemon hosts them
+* transitions per second - start / pause / resume / finish cycles over many
+                          timers sharing one virtual clock
+
+Usage:
+    python benchmarks/timers.py [--timers N] [--cycles N] [--output results.json]
+
+Results are printed as JSON.
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _configs():
+    from pydoro.pydoro_core.config import Configuration
+    from pydoro.pydoro_core.simulation import TRIGGERS
+
+    configs = Configuration([])
+    for trigger in TRIGGERS:
+        setattr(configs, trigger, [])
+    configs.no_sound = True
+    configs.history = False
+    return configs
+
+
+def bench_memory(configs, timers):
+    from pydoro.pydoro_core.clock import VirtualClock
+    from pydoro.pydoro_core.tomato import Tomato
+
+    clock = VirtualClock()
+    results = {}
+    for kind in ("idle", "running", "paused"):
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        hosted = []
+        for _ in range(timers):
+            tomato = Tomato(configs, clock)
+            if kind != "idle":
+                tomato.start()
+            if kind == "paused":
+                tomato.pause()
+            hosted.append(tomato)
+        gc.collect()
+        used = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        results["bytes_per_timer." + kind] = round(used / timers)
+        del hosted
+    return results
+
+
+def bench_transitions(configs, timers, cycles):
+    from pydoro.pydoro_core.clock import VirtualClock
+    from pydoro.pydoro_core.tomato import Tomato
+
+    clock = VirtualClock()
+    transitions = [0]
+
+    def count(_):
+        transitions[0] += 1
+
+    hosted = []
+    for _ in range(timers):
+        tomato = Tomato(configs, clock)
+        tomato.add_listener(count)
+        hosted.append(tomato)
+
+    started = time.perf_counter()
+    for _ in range(cycles):
+        for tomato in hosted:
+            tomato.start()
+            tomato.pause()
+            tomato.start()
+            clock.advance_to(tomato.next_transition)
+            tomato.update()
+    elapsed = time.perf_counter() - started
+    return {
+        "transitions": transitions[0],
+        "transitions_per_second": round(transitions[0] / elapsed),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser("timers", description="pydoro timer benchmarks")
+    parser.add_argument("--timers", type=int, default=10000)
+    parser.add_argument("--cycles", type=int, default=20, help="periods per timer")
+    parser.add_argument("--output", metavar="path", help="also write results here")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        # WHY: keep the user's config and caches out of the numbers
+        os.environ["HOME"] = home
+        os.environ["XDG_CACHE_HOME"] = os.path.join(home, ".cache")
+        os.environ["PYDORO_CONFIG_FILE"] = os.path.join(home, "pydoro.ini")
+        sys.path.insert(0, ROOT)
+        configs = _configs()
+        results = {"python": sys.version.split()[0], "timers": args.timers}
+        results.update(bench_memory(configs, args.timers))
+        results.update(bench_transitions(configs, args.timers, args.cycles))
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
 #!/bin/bash
 
-pyinstaller -F pydoro/pydoro_tui.py -n pydoro --add-data "./pydoro/pydoro_core/b15.wav:." --add-data "./.venv/lib/python3.7/site-packages/wcwidth:wcwidth" --hidden-import="pkg_resources.py2_warn"
+pyinstaller -F pydoro/pydoro_tui.py -n pydoro --add-data "./pydoro/pydoro_core/b15.wav:." --add-data "./.venv/lib/python3.7/site-packages/wcwidth:wcwidth"
 
@@ -0,0 +1,57 @@
+"""
+Command line entry point
+
+Kept free of prompt_toolkit and audio imports so that commands which exit
+early (--version, --audio-check, ctl) start fast.
+"""
+
+import sys
+
+from pydoro import __version__
+
+
+def main():
+    if sys.argv[1:2] == ["ctl"]:
+        from pydoro.pydoro_core.control import ctl
+
+        sys.exit(ctl(sys.argv[2:]))
+    if sys.argv[1:2] == ["stats"]:
+        from pydoro.pydoro_core.analytics import main as stats
+
+        sys.exit(stats(sys.argv[2:]))
+
+    from pydoro.pydoro_core import metrics
+    from pydoro.pydoro_core.config import ConfigError, Configuration
+
+    try:
+        configs = Configuration()
+    except ConfigError as e:
+        print("pydoro: {}".format(e), file=sys.stderr)
+        sys.exit(2)
+    if configs.audio_check:
+        from pydoro.pydoro_core import sound
+        from pydoro.pydoro_core.util import in_app_path
+
+        # WHY twice: to catch more issues
+        sound.play(in_app_path("b15.wav"), block=True)
+        sound.play(in_app_path("b15.wav"), block=True)
+        sys.exit(0)
+    if configs.show_version:
+        print("pydoro : version - {0}".format(__version__))
+        sys.exit(0)
+
+    if configs.instrument or metrics.enabled:
+        metrics.install()
+
+    if configs.daemon:
+        from pydoro.pydoro_core.daemon import run
+    elif configs.plain:
+        from pydoro.pydoro_core.plain import run
+    else:
+        from pydoro.pydoro_tui import run
+
+    run(configs)
+
+
+if __name__ == "__main__":
+    main()
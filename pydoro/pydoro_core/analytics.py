@@ -0,0 +1,498 @@
+"""
+Productivity statistics over session history
+
+    pydoro stats [--since YYYY-MM-DD] [--compact YYYY-MM-DD] [HISTORY_FILE ...]
+
+History logs (see history.py) are loaded into one array per record field,
+NumPy arrays when NumPy is installed and `array.array`s otherwise, and
+every statistic is computed over whole columns at once. Several logs, one
+per team member for example, can be combined. Without a file the log
+configured under [History] is read.
+
+--compact first folds the days before a date into one summary record per
+day, keeping tomatoes and focus time only, to keep old logs small.
+
+Days, hours and weekdays are in the local time zone.
+"""
+
+import argparse
+import array
+import bisect
+import datetime
+import itertools
+import os
+import sys
+import time
+import zlib
+from collections import namedtuple
+
+from pydoro.pydoro_core.history import (
+    FLAG_LONG_BREAK_DONE,
+    FLAG_SESSION_START,
+    FLAG_SMALL_BREAK_DONE,
+    FLAG_WORK_DONE,
+    RECORD,
+    RECORD_SIZE,
+    STATE_CODES,
+    SUMMARY,
+    TASK_WORK,
+)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+SECONDS_PER_DAY = 86400
+SECONDS_PER_HOUR = 3600
+# 1970-01-01 was a Thursday, Monday is 0
+EPOCH_WEEKDAY = 3
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+WORK = STATE_CODES["work"]
+WORK_PAUSED = STATE_CODES["work paused"]
+BREAK_DONE = FLAG_SMALL_BREAK_DONE | FLAG_LONG_BREAK_DONE
+
+# Field, offset in a record, array type code and NumPy type
+FIELDS = (
+    ("timestamp", 0, "d", "<f8"),
+    ("state", 8, "B", "u1"),
+    ("task", 9, "B", "u1"),
+    ("flags", 10, "B", "u1"),
+    ("remaining", 12, "f", "<f4"),
+    ("tomatoes", 16, "I", "<u4"),
+)
+
+Columns = namedtuple("Columns", [field[0] for field in FIELDS])
+Stats = namedtuple(
+    "Stats",
+    [
+        "records",
+        "active_days",
+        "tomatoes",
+        "focus_minutes",
+        # Focus minutes by local hour of the day the work started, 0 - 23
+        "focus_by_hour",
+        # Focus minutes and completed tomatoes by weekday, Monday first
+        "focus_by_weekday",
+        "tomatoes_by_weekday",
+        # Days in a row with a completed tomato, ending today or yesterday
+        "current_streak",
+        "longest_streak",
+        "work_periods",
+        "pauses",
+        "breaks",
+        # Mean seconds between a break ending and the next period starting
+        "break_overrun",
+    ],
+)
+
+
+def load_columns(paths, use_numpy=None):
+    """
+    Valid records of the history logs at `paths`, one array per field
+
+    Records failing their checksum are dropped. The first record of every
+    log is marked as a session start so that no time is counted across
+    two logs.
+    """
+    if use_numpy is None:
+        use_numpy = numpy is not None
+    load = _numpy_columns if use_numpy else _array_columns
+    parts = []
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+        columns = load(data[: len(data) - len(data) % RECORD_SIZE])
+        if len(columns.flags):
+            columns.flags[0] |= FLAG_SESSION_START
+        parts.append(columns)
+    if use_numpy:
+        return Columns(*(numpy.concatenate(column) for column in zip(*parts)))
+    if not parts:
+        return Columns(*(array.array(field[2]) for field in FIELDS))
+    for part in parts[1:]:
+        for column, more in zip(parts[0], part):
+            column.extend(more)
+    return parts[0]
+
+
+_CRC_TABLE = None
+
+
+def _crc32_rows(rows):
+    """
+    zlib.crc32 of every row of a 2-d uint8 array, a byte column at a time
+    """
+    global _CRC_TABLE
+    if _CRC_TABLE is None:
+        table = []
+        for byte in range(256):
+            crc = byte
+            for _ in range(8):
+                crc = (crc >> 1) ^ 0xEDB88320 if crc & 1 else crc >> 1
+            table.append(crc)
+        _CRC_TABLE = numpy.array(table, dtype=numpy.uint32)
+    crc = numpy.full(len(rows), 0xFFFFFFFF, dtype=numpy.uint32)
+    for column in rows.T:
+        crc = _CRC_TABLE[(crc ^ column) & 0xFF] ^ (crc >> 8)
+    return crc ^ numpy.uint32(0xFFFFFFFF)
+
+
+def _numpy_columns(data):
+    layout = numpy.dtype(
+        {
+            "names": [field[0] for field in FIELDS] + ["crc"],
+            "formats": [field[3] for field in FIELDS] + ["<u4"],
+            "offsets": [field[1] for field in FIELDS] + [RECORD.size],
+            "itemsize": RECORD_SIZE,
+        }
+    )
+    records = numpy.frombuffer(data, dtype=layout)
+    raw = numpy.frombuffer(data, dtype=numpy.uint8).reshape(-1, RECORD_SIZE)
+    valid = _crc32_rows(raw[:, : RECORD.size]) == records["crc"]
+    records = records[valid]
+    return Columns(*(numpy.array(records[field[0]]) for field in FIELDS))
+
+
+def _strided(data, offset, size):
+    """
+    The `size` bytes at `offset` of every record, packed together
+    """
+    packed = bytearray(size * (len(data) // RECORD_SIZE))
+    for i in range(size):
+        packed[i::size] = data[offset + i :: RECORD_SIZE]
+    return packed
+
+
+def _array_columns(data):
+    columns = []
+    for _, offset, code, _ in FIELDS + (("crc", RECORD.size, "I", None),):
+        column = array.array(code, _strided(data, offset, array.array(code).itemsize))
+        if sys.byteorder == "big":
+            column.byteswap()
+        columns.append(column)
+    crcs = columns.pop()
+    view = memoryview(data)
+    valid = [
+        zlib.crc32(view[offset : offset + RECORD.size]) == crc
+        for offset, crc in zip(range(0, len(data), RECORD_SIZE), crcs)
+    ]
+    if not all(valid):
+        columns = [
+            array.array(column.typecode, itertools.compress(column, valid))
+            for column in columns
+        ]
+    return Columns(*columns)
+
+
+def _offset_changes(start, end):
+    """
+    Instants from `start` to `end` at which the local UTC offset changes,
+    starting with `start`, and the offset from each of them on
+    """
+    instants = [start]
+    offsets = [time.localtime(start).tm_gmtoff]
+    # WHY per day: zones change offset at most a few times a year, a daily
+    # probe finds every change and a bisection pins it to the second
+    probe = start
+    while probe < end:
+        after = min(probe + SECONDS_PER_DAY, end)
+        offset = time.localtime(after).tm_gmtoff
+        if offset != offsets[-1]:
+            low, high = probe, after
+            while high - low > 1:
+                middle = (low + high) // 2
+                if time.localtime(middle).tm_gmtoff == offset:
+                    high = middle
+                else:
+                    low = middle
+            instants.append(high)
+            offsets.append(offset)
+        probe = after
+    return instants, offsets
+
+
+def _local_day(timestamp):
+    return int(timestamp + time.localtime(timestamp).tm_gmtoff) // SECONDS_PER_DAY
+
+
+def _streaks(active_days, today):
+    """
+    Current and longest run of consecutive days in sorted `active_days`
+    """
+    longest = run = 0
+    previous = None
+    for day in active_days:
+        run = run + 1 if previous == day - 1 else 1
+        longest = max(longest, run)
+        previous = day
+    current = run if previous is not None and previous >= today - 1 else 0
+    return current, longest
+
+
+def compute(columns, now=None):
+    """
+    Statistics over loaded `columns`, NumPy or array ones
+    """
+    today = _local_day(time.time() if now is None else now)
+    if numpy is not None and isinstance(columns.timestamp, numpy.ndarray):
+        return _numpy_stats(columns, today)
+    return _array_stats(columns, today)
+
+
+def _numpy_stats(c, today):
+    count = len(c.timestamp)
+    ts = c.timestamp
+    local = ts
+    if count:
+        instants, offsets = _offset_changes(int(ts.min()), int(ts.max()) + 1)
+        where = numpy.searchsorted(instants, ts, side="right") - 1
+        local = ts + numpy.array(offsets, dtype=numpy.float64)[where]
+    day = (local // SECONDS_PER_DAY).astype(numpy.int64)
+    hour = (local % SECONDS_PER_DAY // SECONDS_PER_HOUR).astype(numpy.int64)
+    weekday = (day + EPOCH_WEEKDAY) % 7
+
+    live = c.state != SUMMARY
+    summary_work = ~live & (c.task == TASK_WORK)
+    next_ts = numpy.append(ts[1:], numpy.inf)
+    next_flags = numpy.append(c.flags[1:], FLAG_SESSION_START)
+    # A state lasts until the next record, unless pydoro exited meanwhile
+    ended = live & (next_flags & FLAG_SESSION_START == 0)
+    elapsed = numpy.where(ended, next_ts - ts, 0.0)
+
+    worked = numpy.where(
+        ended & (c.state == WORK), numpy.clip(elapsed, 0, c.remaining), 0.0
+    )
+    focus = worked + numpy.where(summary_work, c.remaining, 0.0)
+    done = live & (c.flags & FLAG_WORK_DONE != 0)
+    tomatoes = done + numpy.where(summary_work, c.tomatoes, 0)
+
+    # WHY transitions: a reset or a resumed launch records the same state again
+    previous_state = numpy.insert(c.state[:-1], 0, SUMMARY) if count else c.state
+    was_working = (previous_state == WORK) | (previous_state == WORK_PAUSED)
+    work_periods = int(numpy.count_nonzero(live & (c.state == WORK) & ~was_working))
+    pauses = int(
+        numpy.count_nonzero(live & (c.state == WORK_PAUSED) & (previous_state == WORK))
+    )
+    breaks = ended & (c.flags & BREAK_DONE != 0)
+    overrun = numpy.clip(elapsed[breaks], 0, None)
+    active_days = numpy.unique(day[tomatoes > 0])
+    current, longest = _streaks(active_days.tolist(), today)
+
+    return Stats(
+        records=count,
+        active_days=len(active_days),
+        tomatoes=int(tomatoes.sum()),
+        focus_minutes=float(focus.sum()) / 60,
+        focus_by_hour=(numpy.bincount(hour, worked, 24) / 60).tolist(),
+        focus_by_weekday=(numpy.bincount(weekday, focus, 7) / 60).tolist(),
+        tomatoes_by_weekday=numpy.bincount(weekday, tomatoes, 7).astype(int).tolist(),
+        current_streak=current,
+        longest_streak=longest,
+        work_periods=work_periods,
+        pauses=pauses,
+        breaks=len(overrun),
+        break_overrun=float(overrun.mean()) if len(overrun) else 0.0,
+    )
+
+
+class _ArrayTotals:
+    """
+    Statistics summed one record at a time, for `_array_stats`
+    """
+
+    def __init__(self):
+        self.focus_by_hour = [0.0] * 24
+        self.focus_by_weekday = [0.0] * 7
+        self.tomatoes_by_weekday = [0] * 7
+        self.active_days = set()
+        self.tomatoes = self.work_periods = self.pauses = self.breaks = 0
+        self.focus = self.overrun = 0.0
+
+    def add_summary(self, task, day, remaining, tomatoes):
+        if task != TASK_WORK:
+            return
+        weekday = (day + EPOCH_WEEKDAY) % 7
+        self.focus += remaining
+        self.focus_by_weekday[weekday] += remaining / 60
+        self.tomatoes += tomatoes
+        self.tomatoes_by_weekday[weekday] += tomatoes
+        if tomatoes:
+            self.active_days.add(day)
+
+    def add_live(self, local, state, previous_state, flags, remaining, elapsed):
+        """
+        A state entered at `local` time that lasted `elapsed` seconds, None
+        if pydoro exited before it ended
+        """
+        day = int(local // SECONDS_PER_DAY)
+        weekday = (day + EPOCH_WEEKDAY) % 7
+        if state == WORK:
+            if previous_state not in (WORK, WORK_PAUSED):
+                self.work_periods += 1
+            if elapsed is not None:
+                worked = min(max(elapsed, 0.0), remaining)
+                self.focus += worked
+                hour = int(local % SECONDS_PER_DAY // SECONDS_PER_HOUR)
+                self.focus_by_hour[hour] += worked / 60
+                self.focus_by_weekday[weekday] += worked / 60
+        elif state == WORK_PAUSED and previous_state == WORK:
+            self.pauses += 1
+        if flags & FLAG_WORK_DONE:
+            self.tomatoes += 1
+            self.tomatoes_by_weekday[weekday] += 1
+            self.active_days.add(day)
+        if flags & BREAK_DONE and elapsed is not None:
+            self.breaks += 1
+            self.overrun += max(elapsed, 0.0)
+
+
+def _array_stats(c, today):
+    count = len(c.timestamp)
+    if count:
+        instants, offsets = _offset_changes(
+            int(min(c.timestamp)), int(max(c.timestamp)) + 1
+        )
+    totals = _ArrayTotals()
+    previous_state = SUMMARY
+
+    rows = zip(c.timestamp, c.state, c.task, c.flags, c.remaining, c.tomatoes)
+    next_rows = itertools.chain(
+        zip(c.timestamp[1:], c.flags[1:]), ((0.0, FLAG_SESSION_START),)
+    )
+    for (ts, state, task, flags, remaining, count_), (next_ts, next_flags) in zip(
+        rows, next_rows
+    ):
+        local = ts + offsets[bisect.bisect_right(instants, ts) - 1]
+        if state == SUMMARY:
+            totals.add_summary(task, int(local // SECONDS_PER_DAY), remaining, count_)
+        else:
+            # A state lasts until the next record, unless pydoro exited meanwhile
+            ended = not next_flags & FLAG_SESSION_START
+            elapsed = next_ts - ts if ended else None
+            totals.add_live(local, state, previous_state, flags, remaining, elapsed)
+        previous_state = state
+
+    current, longest = _streaks(sorted(totals.active_days), today)
+    return Stats(
+        records=count,
+        active_days=len(totals.active_days),
+        tomatoes=totals.tomatoes,
+        focus_minutes=totals.focus / 60,
+        focus_by_hour=totals.focus_by_hour,
+        focus_by_weekday=totals.focus_by_weekday,
+        tomatoes_by_weekday=totals.tomatoes_by_weekday,
+        current_streak=current,
+        longest_streak=longest,
+        work_periods=totals.work_periods,
+        pauses=totals.pauses,
+        breaks=totals.breaks,
+        break_overrun=totals.overrun / totals.breaks if totals.breaks else 0.0,
+    )
+
+
+def since(columns, date):
+    """
+    Only the records from the start of the local `date` on
+    """
+    start = time.mktime(date.timetuple())
+    if numpy is not None and isinstance(columns.timestamp, numpy.ndarray):
+        keep = columns.timestamp >= start
+        return Columns(*(column[keep] for column in columns))
+    keep = [timestamp >= start for timestamp in columns.timestamp]
+    return Columns(
+        *(
+            array.array(column.typecode, itertools.compress(column, keep))
+            for column in columns
+        )
+    )
+
+
+def _bars(labels, values, width=40):
+    top = max(values) or 1
+    for label, value in zip(labels, values):
+        bar = "#" * int(round(value / top * width))
+        print("  {:>3} {:>8.1f} {}".format(label, value, bar))
+
+
+def report(stats):
+    print("records            {:,}".format(stats.records))
+    print("active days        {:,}".format(stats.active_days))
+    print("tomatoes           {:,}".format(stats.tomatoes))
+    print("focus              {:,.1f}h".format(stats.focus_minutes / 60))
+    print(
+        "streak             {} days (longest {})".format(
+            stats.current_streak, stats.longest_streak
+        )
+    )
+    rate = stats.pauses / stats.work_periods if stats.work_periods else 0.0
+    print("pauses per period  {:.2f}".format(rate))
+    minutes, seconds = divmod(int(round(stats.break_overrun)), 60)
+    print(
+        "break overrun      {}min {}s on average over {:,} breaks".format(
+            minutes, seconds, stats.breaks
+        )
+    )
+    print("focus minutes by hour")
+    _bars(["{:02}".format(hour) for hour in range(24)], stats.focus_by_hour)
+    print("focus minutes by weekday")
+    _bars(WEEKDAYS, stats.focus_by_weekday)
+    print("tomatoes by weekday")
+    _bars(WEEKDAYS, stats.tomatoes_by_weekday)
+
+
+def _date(text):
+    return datetime.datetime.strptime(text, "%Y-%m-%d").date()
+
+
+def _compact(paths, before):
+    from pydoro.pydoro_core.history import History
+
+    for path in paths:
+        if not os.path.exists(path):
+            raise FileNotFoundError("no history log: " + path)
+        history = History(path)
+        try:
+            history.compact(before)
+        finally:
+            history.close()
+
+
+def main(args):
+    parser = argparse.ArgumentParser(
+        "pydoro stats", description="Statistics over pydoro history logs"
+    )
+    parser.add_argument(
+        "files", nargs="*", metavar="HISTORY_FILE", help="default: [History] file"
+    )
+    parser.add_argument(
+        "--since",
+        metavar="YYYY-MM-DD",
+        type=_date,
+        help="only count records from this day on",
+    )
+    parser.add_argument(
+        "--compact",
+        metavar="YYYY-MM-DD",
+        type=_date,
+        help="summarize the days before this one in the logs, in place; "
+        "pydoro should not be running",
+    )
+    args = parser.parse_args(args)
+
+    files = args.files
+    if not files:
+        from pydoro.pydoro_core.config import Configuration
+
+        files = [Configuration([]).history_file]
+    try:
+        if args.compact:
+            _compact(files, args.compact)
+        columns = load_columns(files)
+    except OSError as e:
+        print("pydoro stats: {}".format(e), file=sys.stderr)
+        return 1
+    if args.since:
+        columns = since(columns, args.since)
+    report(compute(columns))
+    return 0
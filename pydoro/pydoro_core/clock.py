@@ -0,0 +1,72 @@
+import functools
+import time
+
+NS_PER_SECOND = 1000000000
+
+try:
+    monotonic_ns = time.monotonic_ns
+    perf_counter_ns = time.perf_counter_ns
+    time_ns = time.time_ns
+except AttributeError:
+    # python 3.6
+    def monotonic_ns():
+        return int(time.monotonic() * NS_PER_SECOND)
+
+    def perf_counter_ns():
+        return int(time.perf_counter() * NS_PER_SECOND)
+
+    def time_ns():
+        return int(time.time() * NS_PER_SECOND)
+
+
+def to_ns(seconds):
+    return int(round(seconds * NS_PER_SECOND))
+
+
+# Longest sleep trusted by a clock that keeps counting during suspend
+SUSPEND_CHECK = to_ns(5)
+CLOCKS = ("monotonic", "boottime")
+
+
+class RealClock:
+    """
+    Monotonic clock, `now()` is in integer nanoseconds
+
+    "monotonic" stands still while the machine is suspended, "boottime"
+    keeps counting (Linux only, it falls back to "monotonic" elsewhere).
+    Neither follows changes of the wall clock.
+
+    Sleeps are measured without suspend time, so with "boottime" callers
+    should not sleep longer than `max_wait` nanoseconds at once.
+    """
+
+    def __init__(self, kind="monotonic"):
+        self.max_wait = None
+        clock_id = getattr(time, "CLOCK_BOOTTIME", None)
+        if kind == "boottime" and clock_id is not None:
+            self.kind = kind
+            self.now = functools.partial(time.clock_gettime_ns, clock_id)
+            self.max_wait = SUSPEND_CHECK
+        else:
+            self.kind = "monotonic"
+            self.now = monotonic_ns
+
+
+class VirtualClock:
+    """
+    Clock that only moves when told to, for simulations
+    """
+
+    max_wait = None
+
+    def __init__(self, start=0):
+        self._now = start
+
+    def now(self):
+        return self._now
+
+    def advance(self, ns):
+        self._now += ns
+
+    def advance_to(self, instant):
+        self._now = max(self._now, instant)
@@ -1,29 +1,355 @@
 import argparse
-import configparser
+import json
 import os
-import ast
+from collections import namedtuple
 
+from pydoro.pydoro_core.clock import CLOCKS
+from pydoro.pydoro_core.filewatch import file_stamp
 from pydoro.pydoro_core.util import in_app_path, open_file_in_default_editor
 
+# Validated settings of the last config file read, so that launches with an
+# unchanged file skip configparser and literal_eval altogether
+CACHE_FILE = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "pydoro",
+    "config.json",
+)
+# Bump when a cached value would be read differently
+CACHE_VERSION = 2
+# Longest wait between two alarms that can be configured, a day
+MAX_ALARM_SECONDS = 86400
+
+# Settings only read when pydoro starts, a reload does not apply them
+RESTART_SETTINGS = {
+    "control_socket",
+    "status_file",
+    "cmd_timeout_seconds",
+    "max_concurrent_cmds",
+    "history",
+    "history_file",
+    "clock",
+    "resume",
+    "state_file",
+}
+
+
+class ConfigError(ValueError):
+    """
+    Invalid config file, `errors` lists every problem found in it
+    """
+
+    def __init__(self, path, errors):
+        self.errors = errors
+        super().__init__(
+            "invalid config file {}:\n  {}".format(path, "\n  ".join(errors))
+        )
+
+
+def _boolean(text):
+    lowered = text.strip().lower()
+    if lowered in ("true", "yes", "on", "1"):
+        return True
+    if lowered in ("false", "no", "off", "0"):
+        return False
+    raise ValueError("expected True or False, got {!r}".format(text))
+
+
+def _number(kind, minimum, maximum=None):
+    def convert(text):
+        value = kind(text)
+        # WHY not <: nan compares false to everything and must not pass
+        if not value >= minimum:
+            raise ValueError("must be at least {}, got {}".format(minimum, value))
+        if maximum is not None and not value <= maximum:
+            raise ValueError("must be at most {}, got {}".format(maximum, value))
+        return value
+
+    return convert
+
+
+def _command(text):
+    import ast
+
+    try:
+        value = ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        value = None
+    if not isinstance(value, list) or not all(isinstance(a, str) for a in value):
+        raise ValueError(
+            "expected a list of strings such as ['notify-send', 'pydoro'], "
+            "got {!r}".format(text)
+        )
+    return value
+
+
+def _choice(*choices):
+    def convert(text):
+        value = text.strip().lower()
+        if value not in choices:
+            raise ValueError(
+                "expected one of {}, got {!r}".format(", ".join(choices), text)
+            )
+        return value
+
+    return convert
+
+
+def _tone(text):
+    value = text.strip().lower()
+    if value in ("", "off"):
+        return "off"
+    from pydoro.pydoro_core import tones
+
+    tones.parse(value)
+    return value
+
+
+def _path(text):
+    return os.path.expanduser(text)
+
+
+def _timer_names(text):
+    names = [name.strip() for name in text.split(",") if name.strip()]
+    if len(set(names)) != len(names):
+        raise argparse.ArgumentTypeError("timer names must differ")
+    for name in names:
+        if not name.replace("-", "").replace("_", "").isalnum():
+            raise argparse.ArgumentTypeError(
+                "timer names are letters, digits, - and _, got {!r}".format(name)
+            )
+    return names
+
+
+def _key_bindings(section):
+    return {action: keys for action, keys in section.items() if keys.strip()}
+
+
+# `key` None stands for the whole section
+Setting = namedtuple("Setting", "name section key default convert")
+
+SETTINGS = (
+    Setting("no_clock", "General", "no_clock", "False", _boolean),
+    Setting("no_sound", "General", "no_sound", "False", _boolean),
+    Setting("emoji", "General", "emoji", "False", _boolean),
+    Setting("audio_file", "General", "audio_file", "", str),
+    Setting("tone", "General", "tone", "off", _tone),
+    Setting("audio_sink", "General", "audio_sink", "[]", _command),
+    Setting("control_socket", "General", "control_socket", "True", _boolean),
+    Setting("status_file", "General", "status_file", "True", _boolean),
+    Setting("low_power", "General", "low_power", "False", _boolean),
+    Setting("resume", "General", "resume", "True", _boolean),
+    Setting(
+        "state_file", "General", "state_file", "~/.local/state/pydoro/timer.bin", _path
+    ),
+    Setting("tomatoes_per_set", "Time", "tomatoes_per_set", "4", _number(int, 1)),
+    Setting("work_minutes", "Time", "work_minutes", "25", _number(float, 0)),
+    Setting(
+        "small_break_minutes", "Time", "small_break_minutes", "5", _number(float, 0)
+    ),
+    Setting(
+        "long_break_minutes", "Time", "long_break_minutes", "15", _number(float, 0)
+    ),
+    Setting("alarm_seconds", "Time", "alarm_seconds", "20", _number(int, 1)),
+    Setting("alarm_backoff", "Time", "alarm_backoff", "2", _number(float, 1, 10)),
+    Setting(
+        "alarm_max_seconds",
+        "Time",
+        "alarm_max_seconds",
+        "300",
+        _number(float, 1, MAX_ALARM_SECONDS),
+    ),
+    Setting("clock", "Time", "clock", "monotonic", _choice(*CLOCKS)),
+    Setting(
+        "key_bindings",
+        "KeyBindings",
+        None,
+        {
+            "focus_previous": "s-tab,left,h,j",
+            "focus_next": "tab,right,l,k",
+            "exit_clicked": "q",
+            "start": "s",
+            "pause": "p",
+            "reset": "r",
+            "reset_all": "a",
+            "help": "?,f1",
+            "next_timer": "],n",
+            "previous_timer": "[",
+        },
+        _key_bindings,
+    ),
+    Setting("work_state_cmd", "Trigger", "work_state_cmd", "[]", _command),
+    Setting(
+        "work_paused_state_cmd", "Trigger", "work_paused_state_cmd", "[]", _command
+    ),
+    Setting(
+        "work_resumed_state_cmd", "Trigger", "work_resumed_state_cmd", "[]", _command
+    ),
+    Setting("long_break_state_cmd", "Trigger", "long_break_state_cmd", "[]", _command),
+    Setting(
+        "small_break_state_cmd", "Trigger", "small_break_state_cmd", "[]", _command
+    ),
+    Setting("exit_cmd", "Trigger", "exit_cmd", "[]", _command),
+    Setting("hook_process_cmd", "Trigger", "hook_process_cmd", "[]", _command),
+    Setting(
+        "cmd_timeout_seconds", "Trigger", "cmd_timeout_seconds", "30", _number(float, 0)
+    ),
+    Setting(
+        "max_concurrent_cmds", "Trigger", "max_concurrent_cmds", "2", _number(int, 1)
+    ),
+    Setting("history", "History", "enabled", "False", _boolean),
+    Setting(
+        "history_file", "History", "file", "~/.local/share/pydoro/history.bin", _path
+    ),
+)
+
+# Set from the command line only
+CLI_SETTINGS = (
+    "audio_check",
+    "show_version",
+    "daemon",
+    "instrument",
+    "timers",
+    "plain",
+)
+
+
+def config_file_path():
+    return os.environ.get(
+        "PYDORO_CONFIG_FILE", os.path.expanduser("~/.config/pydoro/pydoro.ini")
+    )
+
+
+def _defaults():
+    sections = {}
+    for setting in SETTINGS:
+        section = sections.setdefault(setting.section, {})
+        if setting.key is None:
+            section.update(setting.default)
+        else:
+            section[setting.key] = setting.default
+    return sections
+
+
+def _compile(path):
+    """
+    Read and validate the ini file at `path`, created with the defaults if
+    missing. Returns the value of every setting by name.
+    """
+    import configparser
+
+    parser = configparser.ConfigParser()
+    parser.read_dict(_defaults())
+    if os.path.exists(path):
+        try:
+            parser.read(path)
+        except configparser.Error as e:
+            raise ConfigError(path, [str(e)]) from None
+    else:
+        _create_default_ini(parser, path)
+
+    values, errors = {}, []
+    for setting in SETTINGS:
+        section = parser[setting.section]
+        try:
+            if setting.key is None:
+                values[setting.name] = setting.convert(section)
+            else:
+                values[setting.name] = setting.convert(section[setting.key])
+        except (ValueError, configparser.Error) as e:
+            key = setting.key or "*"
+            errors.append("[{}] {}: {}".format(setting.section, key, e))
+    if errors:
+        raise ConfigError(path, errors)
+    return values
+
+
+def _create_default_ini(parser, filename):
+    """
+    Creates default ini configuration file
+    Saves it in '~/.config/pydoro/pydoro.ini' or the location specified by PYDORO_CONFIG_FILE environment variable
+    """
+    config_dir = os.path.dirname(os.path.abspath(filename))
+    os.makedirs(config_dir, exist_ok=True)
+
+    with open(filename, "w+") as configfile:
+        parser.write(configfile)
+
+
+def _load_cached(path, stamp):
+    try:
+        with open(CACHE_FILE) as f:
+            cached = json.load(f)
+        if (
+            cached["version"] == CACHE_VERSION
+            and cached["path"] == path
+            and cached["stamp"] == list(stamp)
+            and set(cached["values"]) == {s.name for s in SETTINGS}
+        ):
+            return cached["values"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def _store_cached(path, stamp, values):
+    cached = {"version": CACHE_VERSION, "path": path, "stamp": stamp, "values": values}
+    tmp_path = CACHE_FILE + ".tmp"
+    try:
+        os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
+        with open(tmp_path, "w") as f:
+            json.dump(cached, f)
+        os.replace(tmp_path, CACHE_FILE)
+    except OSError:
+        pass
+
 
 class Configuration:
-    def __init__(self):
-        self._cli_parse()
+    __slots__ = (
+        tuple(setting.name for setting in SETTINGS)
+        + CLI_SETTINGS
+        + ("cli_args", "config_file", "_stamp")
+    )
+
+    def __init__(self, argv=None):
+        self._cli_parse(argv)
+        self.config_file = config_file_path()
 
         # Check if user wants to edit config before doing anything else
         if self.cli_args.edit_config:
-            config_file_path = os.environ.get(
-                "PYDORO_CONFIG_FILE", os.path.expanduser("~/.config/pydoro/pydoro.ini")
-            )
-            open_file_in_default_editor(config_file_path)
+            open_file_in_default_editor(self.config_file)
 
-        self._ini_parse()
         self._ini_load()
         self._cli_load()
 
-    def _cli_parse(self):
+    def reload(self):
+        """
+        Re-read the config file if it changed since it was last read
+
+        Command line arguments still override it. Settings in
+        RESTART_SETTINGS keep the value they started with. Returns the names
+        of the settings whose value changed. A file that fails to load is
+        ignored and the current settings are kept.
+        """
+        if file_stamp(self.config_file) == self._stamp:
+            return set()
+        before = self._settings()
+        try:
+            self._ini_load()
+        except ConfigError:
+            return set()
+        self._cli_load()
+        for name in RESTART_SETTINGS:
+            setattr(self, name, before[name])
+        after = self._settings()
+        return {name for name, value in after.items() if before[name] != value}
+
+    def _settings(self):
+        return {setting.name: getattr(self, setting.name) for setting in SETTINGS}
+
+    def _cli_parse(self, argv=None):
         """
         Parse command line arguments
+        Uses sys.argv unless `argv` is given
         """
         parser = argparse.ArgumentParser(
             "pydoro", description="Terminal Pomodoro Timer"
@@ -42,6 +368,11 @@ class Configuration:
         )
         parser.add_argument("--no-clock", help="hides clock", action="store_true")
         parser.add_argument("--no-sound", help="mutes all sounds", action="store_true")
+        parser.add_argument(
+            "--low-power",
+            help="redraw at most once a minute, showing whole minutes only",
+            action="store_true",
+        )
         parser.add_argument(
             "--audio-check", help="play audio and exit", action="store_true"
         )
@@ -50,99 +381,51 @@ class Configuration:
         )
         parser.add_argument("--audio-file", metavar="path", help="custom audio file")
         parser.add_argument("--edit-config", help="open config file in editor", action="store_true")
-        self.cli_args = parser.parse_args()
-
-    def _ini_parse(self):
-        """
-        Parse configuration file
-        Look at PYDORO_CONFIG_FILE environment variable
-        Defaults to ~/.pydoro.ini if PYDORO_CONFIG_FILE not set
-        """
-        self._conf = configparser.ConfigParser()
-        self._conf["DEFAULT"] = {}
-
-        self._conf["General"] = {}
-        self._conf["General"]["no_clock"] = "False"
-        self._conf["General"]["no_sound"] = "False"
-        self._conf["General"]["emoji"] = "False"
-        self._conf["General"]["audio_file"] = ""
-
-        self._conf["Time"] = {}
-        self._conf["Time"]["tomatoes_per_set"] = "4"
-        self._conf["Time"]["work_minutes"] = "25"
-        self._conf["Time"]["small_break_minutes"] = "5"
-        self._conf["Time"]["long_break_minutes"] = "15"
-        self._conf["Time"]["alarm_seconds"] = "20"
-
-        self._conf["KeyBindings"] = {}
-        self._conf["KeyBindings"]["focus_previous"] = "s-tab,left,h,j"
-        self._conf["KeyBindings"]["focus_next"] = "tab,right,l,k"
-        self._conf["KeyBindings"]["exit_clicked"] = "q"
-        self._conf["KeyBindings"]["start"] = "s"
-        self._conf["KeyBindings"]["pause"] = "p"
-        self._conf["KeyBindings"]["reset"] = "r"
-        self._conf["KeyBindings"]["reset_all"] = "a"
-        self._conf["KeyBindings"]["help"] = "?,f1"
-
-        self._conf["Trigger"] = {}
-        self._conf["Trigger"]["work_state_cmd"] = "[]"
-        self._conf["Trigger"]["work_paused_state_cmd"] = "[]"
-        self._conf["Trigger"]["work_resumed_state_cmd"] = "[]"
-        self._conf["Trigger"]["long_break_state_cmd"] = "[]"
-        self._conf["Trigger"]["small_break_state_cmd"] = "[]"
-        self._conf["Trigger"]["exit_cmd"] = "[]"
-
-        filename = os.environ.get(
-            "PYDORO_CONFIG_FILE", os.path.expanduser("~/.config/pydoro/pydoro.ini")
+        parser.add_argument(
+            "--instrument",
+            help="record timings, see `pydoro ctl metrics`",
+            action="store_true",
         )
-
-        if os.path.exists(filename):
-            self._conf.read(filename)
-        else:
-            self._create_default_ini(filename)
-
-    def _create_default_ini(self, filename):
-        """
-        Creates default ini configuration file
-        Saves it in '~/.config/pydoro/pydoro.ini' or the location specified by PYDORO_CONFIG_FILE environment variable
-        """
-        config_dir = os.path.expanduser("~/.config/pydoro")
-        os.makedirs(config_dir, exist_ok=True)
-        os.chdir(config_dir)
-
-        with open(filename, "w+") as configfile:
-            self._conf.write(configfile)
+        parser.add_argument(
+            "--timers",
+            metavar="a,b,c",
+            type=_timer_names,
+            default=[],
+            help="show several named timers side by side",
+        )
+        parser.add_argument(
+            "--plain",
+            help="lightweight frontend drawing with plain ANSI escape codes",
+            action="store_true",
+        )
+        parser.add_argument(
+            "--daemon",
+            help="run headless, hosting timers controlled through stdin",
+            action="store_true",
+        )
+        self.cli_args = parser.parse_args(argv)
 
     def _ini_load(self):
         """
         Loads the .ini config file preferences
+        Look at PYDORO_CONFIG_FILE environment variable
+        Defaults to ~/.config/pydoro/pydoro.ini if PYDORO_CONFIG_FILE not set
 
-        Command line arguments override file configurations.
+        The file is only parsed when it changed since the compiled settings
+        were cached. Raises ConfigError, before changing any setting, if it
+        has invalid values.
         """
-        self.no_clock = self._conf["General"]["no_clock"] == "True"
-        self.no_sound = self._conf["General"]["no_sound"] == "True"
-        self.audio_file = self._conf["General"].get("audio_file", "")
-        self.emoji = self._conf["General"]["emoji"] == "True"
-        self.tomatoes_per_set = int(self._conf["Time"]["tomatoes_per_set"])
-        self.work_minutes = float(self._conf["Time"]["work_minutes"])
-        self.small_break_minutes = float(self._conf["Time"]["small_break_minutes"])
-        self.long_break_minutes = float(self._conf["Time"]["long_break_minutes"])
-        self.alarm_seconds = int(self._conf["Time"]["alarm_seconds"])
-        self.key_bindings = self._conf["KeyBindings"]
-        self.work_state_cmd = ast.literal_eval(self._conf["Trigger"]["work_state_cmd"])
-        self.work_paused_state_cmd = ast.literal_eval(
-            self._conf["Trigger"]["work_paused_state_cmd"]
-        )
-        self.small_break_state_cmd = ast.literal_eval(
-            self._conf["Trigger"]["small_break_state_cmd"]
-        )
-        self.long_break_state_cmd = ast.literal_eval(
-            self._conf["Trigger"]["long_break_state_cmd"]
-        )
-        self.work_resumed_state_cmd = ast.literal_eval(
-            self._conf["Trigger"]["work_resumed_state_cmd"]
-        )
-        self.exit_cmd = ast.literal_eval(self._conf["Trigger"]["exit_cmd"])
+        path = self.config_file
+        stamp = file_stamp(path)
+        values = _load_cached(path, stamp) if stamp else None
+        if values is None:
+            values = _compile(path)
+            stamp = stamp or file_stamp(path)
+            if stamp:
+                _store_cached(path, stamp, values)
+        for name, value in values.items():
+            setattr(self, name, value)
+        self._stamp = stamp
 
     def _cli_load(self):
         """
@@ -153,8 +436,13 @@ class Configuration:
         self.no_clock = self.cli_args.no_clock or self.cli_args.focus or self.no_clock
         self.no_sound = self.cli_args.no_sound or self.cli_args.focus or self.no_sound
         self.emoji = self.cli_args.emoji or self.emoji
+        self.low_power = self.cli_args.low_power or self.low_power
         self.audio_check = self.cli_args.audio_check
         self.show_version = self.cli_args.version
+        self.daemon = self.cli_args.daemon
+        self.instrument = self.cli_args.instrument
+        self.timers = self.cli_args.timers
+        self.plain = self.cli_args.plain
         self.audio_file = (
             self.cli_args.audio_file or self.audio_file or in_app_path("b15.wav")
         )
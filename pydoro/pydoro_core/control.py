@@ -0,0 +1,141 @@
+"""
+Local control socket
+
+A running pydoro listens on a Unix domain socket. A client sends one
+command line (`start`, `pause`, `reset`, `reset_all`, `status`, followed by
+a timer name for the daemon, or `metrics`) and gets one JSON line back.
+
+The client side only needs this module, which imports nothing beyond the
+standard library basics, so `pydoro ctl` round trips in a few milliseconds.
+"""
+
+import json
+import os
+import socket
+import sys
+import tempfile
+
+# Longest command a server accepts
+MAX_COMMAND = 1024
+
+
+def runtime_file(name, env_var):
+    """
+    `env_var` if set, else `name` in XDG_RUNTIME_DIR or the temp dir
+    """
+    path = os.environ.get(env_var)
+    if path:
+        return path
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, name)
+    uid = os.getuid() if hasattr(os, "getuid") else os.getpid()
+    base, ext = os.path.splitext(name)
+    return os.path.join(tempfile.gettempdir(), "{}-{}{}".format(base, uid, ext))
+
+
+def socket_path():
+    return runtime_file("pydoro.sock", "PYDORO_SOCKET")
+
+
+def supported():
+    return hasattr(socket, "AF_UNIX")
+
+
+def request(command, path=None, timeout=2.0):
+    """
+    Send `command` to a running pydoro and return its decoded reply
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(path or socket_path())
+        client.sendall(command.encode("utf-8") + b"\n")
+        client.shutdown(socket.SHUT_WR)
+        reply = b""
+        while True:
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            reply += chunk
+    return json.loads(reply.decode("utf-8"))
+
+
+def _in_use(path):
+    try:
+        request("ping", path, timeout=0.5)
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+async def serve(handler, path=None):
+    """
+    Answer commands with `handler(line) -> dict` until cancelled
+
+    Returns right away, without serving, if another pydoro already owns
+    the socket. A handler raising an exception replies {"error": message}.
+    """
+    import asyncio
+
+    path = path or socket_path()
+    if os.path.exists(path):
+        if _in_use(path):
+            return
+        os.unlink(path)
+
+    async def answer(reader, writer):
+        try:
+            line = (await reader.readline())[:MAX_COMMAND].decode("utf-8").strip()
+            if line == "ping":
+                reply = {"ok": True}
+            else:
+                try:
+                    reply = handler(line)
+                except Exception as e:
+                    reply = {"error": str(e)}
+            writer.write(json.dumps(reply).encode("utf-8") + b"\n")
+            await writer.drain()
+        finally:
+            writer.close()
+
+    server = await asyncio.start_unix_server(answer, path)
+    os.chmod(path, 0o600)
+    try:
+        await asyncio.Future()
+    finally:
+        server.close()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def ctl(args):
+    """
+    `pydoro ctl COMMAND [TIMER]`, prints the reply as JSON
+    `pydoro ctl watch` streams the status file instead
+    """
+    if not args or args[0] in ("-h", "--help"):
+        print(
+            "usage: pydoro ctl "
+            "start|pause|reset|reset_all|status|metrics|watch [TIMER]"
+        )
+        return 0 if args else 2
+    if args == ["watch"]:
+        from pydoro.pydoro_core.status import status_path, watch
+
+        try:
+            watch()
+        except (OSError, ValueError) as e:
+            message = "pydoro ctl: cannot read status file {}: {}"
+            print(message.format(status_path(), e), file=sys.stderr)
+            return 1
+        return 0
+    try:
+        reply = request(" ".join(args))
+    except (OSError, ValueError) as e:
+        message = "pydoro ctl: cannot reach pydoro at {}: {}"
+        print(message.format(socket_path(), e), file=sys.stderr)
+        return 1
+    print(json.dumps(reply))
+    return 1 if "error" in reply else 0
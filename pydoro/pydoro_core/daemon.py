@@ -0,0 +1,226 @@
+"""
+Headless pydoro service hosting many timers on one asyncio loop
+
+Every timer is an ordinary Tomato. The instants at which running timers
+finish their period sit in a single heap, so the loop only wakes up for
+the timer that expires next and the cost does not grow with idle timers.
+
+Commands are read one per line from stdin, and from the control socket
+(see `pydoro ctl`), and answered with one JSON line:
+
+    add NAME | remove NAME | list | metrics
+    start NAME | pause NAME | reset NAME | reset_all NAME | status [NAME]
+
+While the control socket is served the daemon keeps running after stdin
+is closed.
+"""
+
+import asyncio
+import copy
+import heapq
+import itertools
+import json
+import signal
+import sys
+import threading
+
+from pydoro.pydoro_core import control, metrics, triggers
+from pydoro.pydoro_core.clock import NS_PER_SECOND, RealClock
+from pydoro.pydoro_core.hooks import HookProcess
+from pydoro.pydoro_core.tomato import Tomato
+
+ACTIONS = ("start", "pause", "reset", "reset_all")
+COMMANDS = ACTIONS + ("add", "remove", "status")
+
+
+class CommandError(Exception):
+    pass
+
+
+class TimerService:
+    def __init__(self, configs, clock=None):
+        # WHY: timers share one hook process and never play sounds on the host
+        self._hook = None
+        if configs.hook_process_cmd:
+            self._hook = HookProcess(configs.hook_process_cmd)
+        # WHY one executor: max_concurrent_cmds bounds commands of all timers
+        self._triggers = triggers.TriggerExecutor(
+            configs.cmd_timeout_seconds, configs.max_concurrent_cmds
+        )
+        self._configs = copy.copy(configs)
+        self._configs.no_sound = True
+        self._configs.hook_process_cmd = []
+        self._configs.history = False
+        self.clock = clock or RealClock(configs.clock)
+        self._timers = {}
+        self._heap = []
+        self._sequence = itertools.count()
+        self._wakeup = None
+
+    def __len__(self):
+        return len(self._timers)
+
+    def add(self, name):
+        if name in self._timers:
+            raise CommandError("timer exists: " + name)
+        tomato = Tomato(self._configs, self.clock)
+        tomato.triggers = self._triggers
+        if self._hook is not None:
+            tomato.add_listener(lambda t: self._hook.notify(t, timer=name))
+        self._timers[name] = tomato
+        return tomato
+
+    def remove(self, name):
+        # Heap entries of a removed timer are skipped when they come up
+        self._get(name).shutdown(0)
+        del self._timers[name]
+
+    def act(self, name, action):
+        if action not in ACTIONS:
+            raise CommandError("unknown action: " + action)
+        tomato = self._get(name)
+        getattr(tomato, action)()
+        self._schedule(name, tomato)
+        return tomato
+
+    def status(self, name):
+        return dict(self._get(name).describe(), timer=name)
+
+    def names(self):
+        return sorted(self._timers)
+
+    def _get(self, name):
+        try:
+            return self._timers[name]
+        except KeyError:
+            raise CommandError("no such timer: " + name) from None
+
+    def _schedule(self, name, tomato):
+        deadline = tomato.next_transition
+        if deadline is None:
+            return
+        heapq.heappush(self._heap, (deadline, next(self._sequence), name))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _expire(self):
+        """
+        Move every timer whose period ended on to its next state
+        """
+        now = self.clock.now()
+        while self._heap and self._heap[0][0] <= now:
+            deadline, _, name = heapq.heappop(self._heap)
+            tomato = self._timers.get(name)
+            # WHY: pausing or resetting leaves a stale entry behind
+            if tomato is None or tomato.next_transition != deadline:
+                continue
+            tomato.update()
+            self._schedule(name, tomato)
+
+    async def run(self):
+        self._wakeup = asyncio.Event()
+        while True:
+            self._expire()
+            timeout = None
+            if self._heap:
+                timeout = max(0, self._heap[0][0] - self.clock.now())
+                if self.clock.max_wait is not None:
+                    timeout = min(timeout, self.clock.max_wait)
+                timeout /= NS_PER_SECOND
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def execute(self, line):
+        """
+        Run one text command, returns the reply as a dict
+        """
+        words = line.split()
+        if not words:
+            raise CommandError("empty command")
+        command, args = words[0], words[1:]
+        if command == "list":
+            return {"timers": self.names()}
+        if command == "metrics":
+            return dict(metrics.report(), triggers=triggers.report([self._triggers]))
+        if command == "status" and not args:
+            return {"timers": [self.status(name) for name in self.names()]}
+        if command not in COMMANDS:
+            raise CommandError("unknown command: " + command)
+        if len(args) != 1:
+            raise CommandError("usage: {} NAME".format(command))
+        name = args[0]
+        if command == "add":
+            self.add(name)
+        elif command == "remove":
+            self.remove(name)
+            return {"ok": True}
+        elif command != "status":
+            self.act(name, command)
+        return self.status(name)
+
+    def shutdown(self, timeout=None):
+        self._triggers.join(timeout)
+        for tomato in self._timers.values():
+            tomato.shutdown(timeout)
+        if self._hook is not None:
+            self._hook.close(timeout)
+
+
+def _stdin_lines(loop, lines):
+    for line in sys.stdin:
+        loop.call_soon_threadsafe(lines.put_nowait, line)
+    loop.call_soon_threadsafe(lines.put_nowait, None)
+
+
+async def _read_commands(service):
+    lines = asyncio.Queue()
+    # WHY a daemon thread: a blocked read must not keep the process alive
+    threading.Thread(
+        target=_stdin_lines, args=(asyncio.get_event_loop(), lines), daemon=True
+    ).start()
+    while True:
+        line = await lines.get()
+        if line is None:
+            return
+        try:
+            reply = service.execute(line)
+        except CommandError as e:
+            reply = {"error": str(e)}
+        print(json.dumps(reply), flush=True)
+
+
+async def _serve(service, configs):
+    tasks = [asyncio.ensure_future(service.run())]
+    if configs.control_socket and control.supported():
+        tasks.append(asyncio.ensure_future(control.serve(service.execute)))
+    try:
+        await _read_commands(service)
+        if len(tasks) > 1:
+            # Keep serving the control socket, if it is ours, once stdin is done
+            await tasks[1]
+    finally:
+        for task in tasks:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+
+def run(configs):
+    service = TimerService(configs)
+    loop = asyncio.new_event_loop()
+    serving = loop.create_task(_serve(service, configs))
+    if hasattr(signal, "SIGTERM") and sys.platform != "win32":
+        # WHY: cancel instead of dying so the control socket gets removed
+        loop.add_signal_handler(signal.SIGTERM, serving.cancel)
+    try:
+        loop.run_until_complete(serving)
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    finally:
+        loop.close()
+        service.shutdown(configs.cmd_timeout_seconds or None)
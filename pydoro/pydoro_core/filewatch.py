@@ -0,0 +1,104 @@
+"""
+Watch a file for changes
+
+On Linux the directory holding the file is watched with inotify, so an
+idle watcher costs nothing and editors that save by renaming a temporary
+file over the original are noticed too. Elsewhere, or when inotify is not
+available, the modification time and size of the file are polled.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+import threading
+import time
+
+POLL_SECONDS = 1.0
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CLOEXEC = 0o2000000
+# WHY: written and closed, or renamed into place, never half-saved files
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO
+
+# watch descriptor, mask, cookie, length of the name that follows
+EVENT = struct.Struct("iIII")
+
+
+def file_stamp(path):
+    """
+    (modification time, size) of `path`, None if it does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _inotify(directory):
+    """
+    inotify descriptor watching `directory`, None if unsupported
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(IN_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(directory), WATCH_MASK) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+class FileWatcher:
+    """
+    Calls `callback()` from a background thread when `path` may have changed
+
+    Several calls can follow a single save, `callback` is expected to check
+    for itself whether anything changed.
+    """
+
+    def __init__(self, path, callback):
+        self._path = os.path.abspath(path)
+        self._callback = callback
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        fd = _inotify(os.path.dirname(self._path))
+        if fd is None:
+            self._poll()
+        else:
+            self._watch(fd)
+
+    def _watch(self, fd):
+        name = os.fsencode(os.path.basename(self._path))
+        while True:
+            data = os.read(fd, 4096)
+            changed = False
+            offset = 0
+            while offset < len(data):
+                _, _, _, length = EVENT.unpack_from(data, offset)
+                offset += EVENT.size
+                if data[offset : offset + length].rstrip(b"\0") == name:
+                    changed = True
+                offset += length
+            if changed:
+                self._callback()
+
+    def _poll(self):
+        stamp = file_stamp(self._path)
+        while True:
+            time.sleep(POLL_SECONDS)
+            current = file_stamp(self._path)
+            if current != stamp:
+                stamp = current
+                self._callback()
@@ -0,0 +1,446 @@
+"""
+Append-only session history
+
+Every state transition is appended to a log of fixed-size binary records,
+each with its own CRC so a torn or corrupt record is detected and skipped.
+A small side index keeps per-day running totals of completed periods and
+focus time, so totals over any date range are two binary searches away
+instead of a scan over the whole log. The index can always be rebuilt from
+the log, compaction folds old days into summary records to keep it so.
+"""
+
+import bisect
+import datetime
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+# timestamp, state, task, flags, remaining seconds, tomatoes
+RECORD = struct.Struct("<dBBBxfI")
+CRC = struct.Struct("<I")
+RECORD_SIZE = RECORD.size + CRC.size
+
+# magic, records indexed, crc of the last indexed record
+INDEX_HEADER = struct.Struct("<4sQI")
+INDEX_MAGIC = b"PDH1"
+# day ordinal, then running totals of:
+#   tomatoes, small breaks, long breaks, focus seconds
+INDEX_ENTRY = struct.Struct("<iIIId")
+
+STATE_CODES = {
+    "initial": 0,
+    "waiting": 1,
+    "work": 2,
+    "work paused": 3,
+    "small break": 4,
+    "small break paused": 5,
+    "long break": 6,
+    "long break paused": 7,
+}
+STATE_NAMES = {code: name for name, code in STATE_CODES.items()}
+# Compacted day: task is the label, tomatoes the number of completed periods
+# and remaining the focus seconds of that label on that day
+SUMMARY = 255
+
+FLAG_WORK_DONE = 1
+FLAG_SMALL_BREAK_DONE = 2
+FLAG_LONG_BREAK_DONE = 4
+# First record written by a pydoro run, time is not carried over it
+FLAG_SESSION_START = 8
+
+RUNNING_STATES = {
+    STATE_CODES["work"]: FLAG_WORK_DONE,
+    STATE_CODES["small break"]: FLAG_SMALL_BREAK_DONE,
+    STATE_CODES["long break"]: FLAG_LONG_BREAK_DONE,
+}
+# Values of tomato.Tasks, not imported to keep this module light
+TASK_WORK = 1
+TASK_SMALL_BREAK = 2
+TASK_LONG_BREAK = 3
+# Task of a summary record -> position in Totals
+SUMMARY_LABELS = {
+    TASK_WORK: 0,
+    TASK_SMALL_BREAK: 1,
+    TASK_LONG_BREAK: 2,
+}
+
+Entry = namedtuple("Entry", "timestamp state task flags remaining tomatoes")
+Totals = namedtuple("Totals", "tomatoes small_breaks long_breaks focus_seconds")
+
+ZERO = Totals(0, 0, 0, 0.0)
+
+
+def day_of(timestamp):
+    return datetime.date.fromtimestamp(timestamp).toordinal()
+
+
+def _pack(entry):
+    data = RECORD.pack(*entry)
+    return data + CRC.pack(zlib.crc32(data))
+
+
+def _unpack(data):
+    """
+    Entry stored in `data`, None if its checksum does not match
+    """
+    payload = data[: RECORD.size]
+    if CRC.unpack_from(data, RECORD.size)[0] != zlib.crc32(payload):
+        return None
+    return Entry(*RECORD.unpack(payload))
+
+
+class _Totaller:
+    """
+    Folds entries, in log order, into per-day running totals
+    """
+
+    def __init__(self, days=None, totals=None, last=None):
+        self.days = days or []
+        self.totals = totals or []
+        self.last = last
+
+    def add(self, entry):
+        day = day_of(entry.timestamp)
+        counts = [0, 0, 0, 0.0]
+        if entry.state == SUMMARY:
+            label = SUMMARY_LABELS.get(entry.task)
+            if label is not None:
+                counts[label] = entry.tomatoes
+                counts[3] = entry.remaining if entry.task == TASK_WORK else 0.0
+        else:
+            if entry.flags & FLAG_WORK_DONE:
+                counts[0] = 1
+            if entry.flags & FLAG_SMALL_BREAK_DONE:
+                counts[1] = 1
+            if entry.flags & FLAG_LONG_BREAK_DONE:
+                counts[2] = 1
+            last = self.last
+            if (
+                last is not None
+                and last.state == STATE_CODES["work"]
+                and not entry.flags & FLAG_SESSION_START
+            ):
+                worked = min(entry.timestamp - last.timestamp, last.remaining)
+                counts[3] = max(worked, 0.0)
+            self.last = entry
+
+        previous = self.totals[-1] if self.totals else ZERO
+        row = Totals(*(p + c for p, c in zip(previous, counts)))
+        if self.days and self.days[-1] >= day:
+            # WHY >=: a clock set backwards still lands in the latest day
+            self.totals[-1] = row
+        else:
+            self.days.append(day)
+            self.totals.append(row)
+
+
+class History:
+    """
+    The log at `path` and its index
+
+    Records are appended by a background thread, so a transition never
+    waits for the disk. Records queued while one batch is written go out
+    together with a single fsync.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._index_path = path + ".idx"
+        self._lock = threading.Lock()
+        self._session_started = False
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._log = open(path, "ab+")
+        self._repair_log()
+        self._load_index()
+        # State of the last record, including ones not written yet
+        last = self._totaller.last
+        self._last_state = last.state if last is not None else None
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._thread = None
+        self._closed = False
+
+    def close(self, timeout=None):
+        """
+        Write the queued records, waiting at most `timeout` seconds, then
+        close the log
+        """
+        self.flush(timeout)
+        with self._lock:
+            self._closed = True
+            self._log.close()
+            self._index.close()
+
+    @property
+    def size(self):
+        """
+        Number of records in the log
+        """
+        return os.fstat(self._log.fileno()).st_size // RECORD_SIZE
+
+    def resume(self, tomato):
+        """
+        `tomato` was restored into a period still running, its next record
+        continues the last one of the log when that is the same state
+        """
+        if STATE_CODES.get(tomato.state_name) == self._last_state:
+            self._session_started = True
+
+    def record(self, tomato):
+        """
+        Tomato listener, appends the state it just entered
+        """
+        state = STATE_CODES.get(tomato.state_name, 0)
+        flags = 0
+        if state == STATE_CODES["waiting"]:
+            flags |= RUNNING_STATES.get(self._last_state, 0)
+        self._last_state = state
+        if not self._session_started:
+            flags |= FLAG_SESSION_START
+            self._session_started = True
+        self.append(
+            Entry(
+                time.time(),
+                state,
+                int(tomato.task),
+                flags,
+                tomato.remaining,
+                tomato.tomatoes,
+            )
+        )
+
+    def append(self, entry):
+        """
+        Queue `entry` for the log, it is written in the background
+        """
+        with self._pending_lock:
+            self._pending.append(entry)
+            self._idle.clear()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def flush(self, timeout=None):
+        """
+        Wait until every queued record is in the log
+        """
+        self._idle.wait(timeout)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            with self._pending_lock:
+                entries, self._pending = self._pending, []
+            if entries:
+                self._write(entries)
+            with self._pending_lock:
+                if not self._pending:
+                    self._idle.set()
+
+    def _write(self, entries):
+        packed = [_pack(entry) for entry in entries]
+        with self._lock:
+            if self._closed:
+                return
+            try:
+                self._log.write(b"".join(packed))
+                self._log.flush()
+                os.fsync(self._log.fileno())
+                for entry, data in zip(entries, packed):
+                    self._totaller.add(entry)
+                    self._index_entry(zlib.crc32(data[: RECORD.size]))
+            except OSError:
+                # WHY: a lost record only costs statistics, never the timer
+                pass
+
+    def records(self, start=0):
+        """
+        Yield valid entries from record number `start` on
+        """
+        with open(self._path, "rb") as f:
+            f.seek(start * RECORD_SIZE)
+            while True:
+                chunk = f.read(RECORD_SIZE * 4096)
+                if not chunk:
+                    return
+                for offset in range(0, len(chunk) - RECORD_SIZE + 1, RECORD_SIZE):
+                    entry = _unpack(chunk[offset : offset + RECORD_SIZE])
+                    if entry is not None:
+                        yield entry
+
+    def totals(self, first_day, last_day):
+        """
+        Totals of completed periods and focus time between two dates, inclusive
+        """
+        with self._lock:
+            days, totals = self._totaller.days, self._totaller.totals
+            end = bisect.bisect_right(days, last_day.toordinal())
+            start = bisect.bisect_left(days, first_day.toordinal())
+            if end == 0 or start >= end:
+                return ZERO
+            upper = totals[end - 1]
+            lower = totals[start - 1] if start > 0 else ZERO
+        return Totals(*(u - l for u, l in zip(upper, lower)))
+
+    def totals_for(self, period, today=None):
+        """
+        Totals for the current "day", "week", "month" or "year"
+        """
+        today = today or datetime.date.today()
+        if period == "day":
+            first = today
+        elif period == "week":
+            first = today - datetime.timedelta(days=today.weekday())
+        elif period == "month":
+            first = today.replace(day=1)
+        elif period == "year":
+            first = today.replace(month=1, day=1)
+        else:
+            raise ValueError("unknown period: " + period)
+        return self.totals(first, today)
+
+    def compact(self, before=None):
+        """
+        Rewrite the log without corrupt records, folding the days before
+        the date `before` (if given) into one summary record per label
+        """
+        cutoff = before.toordinal() if before else None
+        tmp_path = self._path + ".tmp"
+        # WHY: records still queued would be appended after the rewrite
+        self.flush()
+        with self._lock:
+            with open(tmp_path, "wb") as out:
+                folded = _Totaller()
+                folding = cutoff is not None
+                for entry in self.records():
+                    if folding and day_of(entry.timestamp) < cutoff:
+                        folded.add(entry)
+                        continue
+                    if folding:
+                        self._write_summaries(out, folded)
+                        folding = False
+                    out.write(_pack(entry))
+                if folding:
+                    self._write_summaries(out, folded)
+                out.flush()
+                os.fsync(out.fileno())
+            self._log.close()
+            os.replace(tmp_path, self._path)
+            self._log = open(self._path, "ab+")
+            self._index.close()
+            self._rebuild_index()
+
+    @staticmethod
+    def _write_summaries(out, folded):
+        previous = ZERO
+        for day, totals in zip(folded.days, folded.totals):
+            delta = Totals(*(t - p for t, p in zip(totals, previous)))
+            previous = totals
+            noon = datetime.datetime.fromordinal(day).replace(hour=12).timestamp()
+            for task, label in SUMMARY_LABELS.items():
+                focus = delta.focus_seconds if task == TASK_WORK else 0.0
+                if delta[label] or focus:
+                    entry = Entry(noon, SUMMARY, task, 0, focus, delta[label])
+                    out.write(_pack(entry))
+
+    def _repair_log(self):
+        """
+        Drop a partially written record left by a crash
+        """
+        size = os.fstat(self._log.fileno()).st_size
+        if size % RECORD_SIZE:
+            self._log.truncate(size - size % RECORD_SIZE)
+
+    def _read_record(self, number):
+        with open(self._path, "rb") as f:
+            f.seek(number * RECORD_SIZE)
+            data = f.read(RECORD_SIZE)
+        return data if len(data) == RECORD_SIZE else None
+
+    def _load_index(self):
+        try:
+            self._index = open(self._index_path, "r+b")
+        except FileNotFoundError:
+            self._rebuild_index()
+            return
+        loaded = self._read_index()
+        if loaded is None:
+            self._index.close()
+            self._rebuild_index()
+            return
+        days, totals, indexed, last = loaded
+        self._totaller = _Totaller(days, totals, _unpack(last) if last else None)
+        self._indexed = indexed
+        self._catch_up()
+
+    def _read_index(self):
+        """
+        Index rows, records indexed and the last indexed record,
+        None if the index is damaged or does not belong to this log
+        """
+        header = self._index.read(INDEX_HEADER.size)
+        body = self._index.read()
+        if len(header) != INDEX_HEADER.size or len(body) % INDEX_ENTRY.size:
+            return None
+        magic, indexed, last_crc = INDEX_HEADER.unpack(header)
+        if magic != INDEX_MAGIC or indexed > self.size:
+            return None
+        last = None
+        if indexed:
+            last = self._read_record(indexed - 1)
+            if last is None or zlib.crc32(last[: RECORD.size]) != last_crc:
+                return None
+
+        days, totals = [], []
+        for offset in range(0, len(body), INDEX_ENTRY.size):
+            day, *row = INDEX_ENTRY.unpack_from(body, offset)
+            days.append(day)
+            totals.append(Totals(*row))
+        return days, totals, indexed, last
+
+    def _rebuild_index(self):
+        self._index = open(self._index_path, "w+b")
+        self._index.write(INDEX_HEADER.pack(INDEX_MAGIC, 0, 0))
+        self._totaller = _Totaller()
+        self._indexed = 0
+        self._catch_up()
+
+    def _catch_up(self):
+        """
+        Index log records written after the index was last updated
+        """
+        number = self._indexed
+        with open(self._path, "rb") as f:
+            f.seek(number * RECORD_SIZE)
+            while True:
+                data = f.read(RECORD_SIZE)
+                if len(data) < RECORD_SIZE:
+                    break
+                entry = _unpack(data)
+                if entry is None:
+                    # A corrupt record is kept in the count but not indexed
+                    self._indexed += 1
+                    continue
+                self._totaller.add(entry)
+                self._index_entry(zlib.crc32(data[: RECORD.size]))
+
+    def _index_entry(self, crc):
+        """
+        Persist the latest index row after one more record was added
+        """
+        days, totals = self._totaller.days, self._totaller.totals
+        self._indexed += 1
+        position = INDEX_HEADER.size + (len(days) - 1) * INDEX_ENTRY.size
+        self._index.seek(position)
+        self._index.write(INDEX_ENTRY.pack(days[-1], *totals[-1]))
+        self._index.seek(0)
+        self._index.write(INDEX_HEADER.pack(INDEX_MAGIC, self._indexed, crc))
+        self._index.flush()
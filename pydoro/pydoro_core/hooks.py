@@ -0,0 +1,99 @@
+import json
+import queue
+import subprocess
+import threading
+import time
+
+# Messages waiting for the hook process before new ones are dropped
+MAX_PENDING = 256
+# Restart delays grow from MIN_BACKOFF up to MAX_BACKOFF seconds
+MIN_BACKOFF = 0.5
+MAX_BACKOFF = 60
+# A hook that stayed up this long is considered healthy again
+HEALTHY_SECONDS = 10
+
+
+class HookProcess:
+    """
+    Keeps one hook program running and streams state transitions to it
+
+    Every transition is written to the program's stdin as a single JSON
+    line. If the program dies it is restarted with exponential backoff and
+    the message that failed is delivered to the new process.
+    """
+
+    def __init__(self, cmd):
+        self._cmd = cmd
+        self._queue = queue.Queue(MAX_PENDING)
+        self._process = None
+        self._started_at = 0
+        self._failures = 0
+        self._thread = None
+        self.dropped = 0
+
+    def notify(self, tomato, timer=None):
+        message = tomato.describe()
+        message["timestamp"] = time.monotonic()
+        if timer is not None:
+            message["timer"] = timer
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        try:
+            self._queue.put_nowait(json.dumps(message) + "\n")
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout=None):
+        """
+        Deliver queued messages, then close the hook's stdin so it can exit
+        """
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            line = self._queue.get()
+            if line is None:
+                self._stop()
+                return
+            while not self._write(line):
+                time.sleep(self._backoff())
+
+    def _write(self, line):
+        if self._process is not None and self._process.poll() is not None:
+            self._process = None
+            # WHY: a hook crashing right after start must not respawn in a loop
+            if time.monotonic() - self._started_at < HEALTHY_SECONDS:
+                return False
+        try:
+            if self._process is None:
+                self._start()
+            self._process.stdin.write(line.encode("utf-8"))
+            self._process.stdin.flush()
+            return True
+        except OSError:
+            self._process = None
+            return False
+
+    def _start(self):
+        if time.monotonic() - self._started_at > HEALTHY_SECONDS:
+            self._failures = 0
+        self._started_at = time.monotonic()
+        self._process = subprocess.Popen(
+            self._cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL
+        )
+
+    def _backoff(self):
+        self._failures += 1
+        return min(MAX_BACKOFF, MIN_BACKOFF * 2 ** (self._failures - 1))
+
+    def _stop(self):
+        if self._process is None:
+            return
+        try:
+            self._process.stdin.close()
+        except OSError:
+            pass
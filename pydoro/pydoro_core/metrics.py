@@ -0,0 +1,169 @@
+"""
+Built-in instrumentation
+
+Off unless PYDORO_INSTRUMENT is set in the environment or pydoro runs with
+--instrument, recording is then a dictionary increment under a lock.
+Durations go into HDR-style histograms (log-linear buckets, a few percent
+precision at any magnitude) and events into plain counters:
+
+    scheduler_lateness  how late the redraw scheduler woke after a deadline
+    render              Tomato.update() + render() in the TUI
+    trigger             run time of [Trigger] commands
+    audio_start         from play() to the backend starting the sound
+    checkpoint          writing a timer snapshot, off the timer's thread
+    frames_emitted      redraws that changed the screen
+    frames_suppressed   redraws skipped because nothing changed
+    alarms_played       alarms started by the voice pool
+    alarms_coalesced    alarms folded into the same sound still playing
+    alarms_dropped      alarms skipped because every voice was busy
+    triggers_failed     [Trigger] commands that failed, timed out or did not start
+    triggers_dropped    [Trigger] commands skipped because too many were queued
+
+`pydoro ctl metrics` returns the report of a running pydoro, along with
+the latest failed [Trigger] commands, SIGUSR1 and exiting write it to the
+metrics file.
+"""
+
+import atexit
+import collections
+import json
+import os
+import signal
+import sys
+import threading
+
+# Sub-buckets per power of two, sets the relative precision (1 / 32 ~ 3%)
+SUB_BUCKET_BITS = 5
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+PERCENTILES = (50, 90, 99, 99.9)
+
+enabled = bool(os.environ.get("PYDORO_INSTRUMENT"))
+
+
+def _bucket(value):
+    if value < SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return (shift + 1) * SUB_BUCKETS + (value >> shift) - SUB_BUCKETS
+
+
+def _highest(bucket):
+    """
+    Largest value that falls in `bucket`
+    """
+    if bucket < SUB_BUCKETS:
+        return bucket
+    shift = bucket // SUB_BUCKETS - 1
+    mantissa = bucket % SUB_BUCKETS + SUB_BUCKETS
+    return ((mantissa + 1) << shift) - 1
+
+
+class Histogram:
+    """
+    Distribution of non-negative integers (nanoseconds here)
+    """
+
+    def __init__(self):
+        self._counts = collections.Counter()
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        value = max(int(value), 0)
+        with self._lock:
+            self._counts[_bucket(value)] += 1
+            self.count += 1
+            self.total += value
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    def percentile(self, percent):
+        with self._lock:
+            if not self.count:
+                return None
+            wanted = max(1, -(-self.count * percent // 100))
+            seen = 0
+            for bucket in sorted(self._counts):
+                seen += self._counts[bucket]
+                if seen >= wanted:
+                    return min(_highest(bucket), self.max)
+        return self.max
+
+    def summary(self):
+        """
+        Count, mean and percentiles in milliseconds
+        """
+        if not self.count:
+            return {"count": 0}
+        result = {
+            "count": self.count,
+            "min_ms": self.min / 1e6,
+            "mean_ms": self.total / self.count / 1e6,
+            "max_ms": self.max / 1e6,
+        }
+        for percent in PERCENTILES:
+            result["p{:g}_ms".format(percent)] = self.percentile(percent) / 1e6
+        return result
+
+
+_histograms = collections.defaultdict(Histogram)
+_counters = collections.Counter()
+_counters_lock = threading.Lock()
+
+
+def record(name, nanoseconds):
+    if enabled:
+        _histograms[name].record(nanoseconds)
+
+
+def count(name, amount=1):
+    if enabled:
+        with _counters_lock:
+            _counters[name] += amount
+
+
+def report():
+    return {
+        "histograms": {
+            name: histogram.summary()
+            for name, histogram in sorted(_histograms.items())
+        },
+        "counters": dict(sorted(_counters.items())),
+    }
+
+
+def report_path():
+    # WHY here: control imports socket and tempfile, every launch imports us
+    from pydoro.pydoro_core.control import runtime_file
+
+    return runtime_file("pydoro.metrics.json", "PYDORO_METRICS_FILE")
+
+
+def dump(*_):
+    """
+    Write the report to the metrics file
+    """
+    path = report_path()
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(report(), f, indent=2)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print("pydoro: cannot write metrics to {}: {}".format(path, e), file=sys.stderr)
+
+
+def install():
+    """
+    Start recording, dump on SIGUSR1 and at exit
+    """
+    global enabled
+    enabled = True
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, dump)
+    atexit.register(dump)
@@ -0,0 +1,257 @@
+"""
+Plain terminal frontend, `pydoro --plain`
+
+Draws the same tomato art as the TUI with raw ANSI escape sequences and
+reads single key presses through termios, without prompt_toolkit. The
+screen is kept as a grid of cells and each redraw only sends the runs of
+cells that changed, so a running timer costs a few bytes a second over a
+slow link. One thread waits in select() for a key, a resize or the next
+instant the shown time changes.
+
+Keys are the single-character ones of [KeyBindings].
+"""
+
+import os
+import select
+import signal
+import sys
+import unicodedata
+
+from pydoro.pydoro_core import metrics
+from pydoro.pydoro_core.clock import NS_PER_SECOND, perf_counter_ns
+from pydoro.pydoro_core.tomato import BOLD_TEXT, GREEN, NO_COLOUR, RED, Tomato
+
+CSI = "\x1b["
+# Style of a fragment -> SGR parameters, every one resets what came before
+SGR = {NO_COLOUR: "0", RED: "0;31", GREEN: "0;32", BOLD_TEXT: "0;1"}
+# Screen row of the first line of the tomato art, 1-based, below the key help
+ART_ROW = 3
+# Unchanged cells between two changes that are rewritten rather than
+# skipped, a cursor movement costs about as many bytes
+GAP = 6
+# Actions available from single keys, and their label in the key help
+ACTIONS = (
+    ("start", "start"),
+    ("pause", "pause"),
+    ("reset", "reset"),
+    ("reset_all", "reset all"),
+    ("exit_clicked", "quit"),
+)
+
+
+def _width(char):
+    return 2 if unicodedata.east_asian_width(char) in ("W", "F") else 1
+
+
+def to_cells(fragments):
+    """
+    Rows of (style, character) cells of formatted text fragments
+
+    A wide character is followed by a None cell standing for its right half.
+    """
+    rows = [[]]
+    for style, text in fragments:
+        for char in text:
+            if char == "\n":
+                rows.append([])
+                continue
+            rows[-1].append((style, char))
+            if _width(char) == 2:
+                rows[-1].append(None)
+    return rows
+
+
+def changed_runs(old, new):
+    """
+    (row, column, cells) of the runs of `new` that differ from `old`,
+    0-based. Cells past the end of a shorter new row become blanks.
+    """
+    blank = (NO_COLOUR, " ")
+    for row in range(len(new)):
+        before = old[row] if row < len(old) else []
+        after = new[row] + [blank] * (len(before) - len(new[row]))
+        start = end = None
+        for column, cell in enumerate(after):
+            if column < len(before) and before[column] == cell:
+                continue
+            if start is not None and column - end > GAP:
+                yield row, start, after[start:end]
+                start = None
+            if start is None:
+                start = column
+            end = column + 1
+        if start is not None:
+            yield row, start, after[start:end]
+
+
+def _keymap(key_bindings):
+    """
+    Character -> action of the single-character key bindings
+    """
+    keys = {}
+    for action, _ in ACTIONS:
+        for key in key_bindings.get(action, "").split(","):
+            key = key.strip()
+            if len(key) == 1:
+                keys.setdefault(key, action)
+    return keys
+
+
+class PlainInterface:
+    def __init__(self, configs, output=None):
+        self.configs = configs
+        self.tomato = Tomato(configs)
+        self._checkpointer = None
+        if configs.resume:
+            from pydoro.pydoro_core.snapshot import Checkpointer
+
+            self._checkpointer = Checkpointer(configs.state_file)
+            self._checkpointer.attach(self.tomato)
+        self._status = None
+        if configs.status_file:
+            from pydoro.pydoro_core.status import StatusWriter
+
+            self._status = StatusWriter()
+        self._out = output or sys.stdout
+        self._keys = _keymap(configs.key_bindings)
+        self._screen = []
+        self._version = None
+        self._pen = None
+
+    def _help(self):
+        labels = {action: label for action, label in ACTIONS}
+        keys = {}
+        for key, action in self._keys.items():
+            keys.setdefault(action, key)
+        return "  ".join(
+            "{} {}".format(keys[action], labels[action])
+            for action, _ in ACTIONS
+            if action in keys
+        )
+
+    def repaint(self):
+        """
+        Forget what is on screen, the next draw sends all of it
+        """
+        self._screen = []
+        self._version = None
+        self._pen = None
+        self._out.write(CSI + "0m" + CSI + "2J" + CSI + "1;1H" + self._help())
+
+    def draw(self):
+        """
+        Send the changed cells, returns the instant the screen can next change
+        """
+        started = perf_counter_ns()
+        self.tomato.update()
+        fragments, version = self.tomato.render()
+        if version != self._version:
+            self._version = version
+            screen = to_cells(fragments)
+            self._out.write(self._diff(screen))
+            self._out.flush()
+            self._screen = screen
+            metrics.count("frames_emitted")
+        else:
+            metrics.count("frames_suppressed")
+        metrics.record("render", perf_counter_ns() - started)
+        if self._status is not None:
+            self._status.publish(self.tomato)
+        return self.tomato.next_change
+
+    def _diff(self, screen):
+        parts = []
+        for row, column, cells in changed_runs(self._screen, screen):
+            parts.append("{}{};{}H".format(CSI, ART_ROW + row, column + 1))
+            for cell in cells:
+                if cell is None:
+                    continue
+                style, char = cell
+                if style != self._pen:
+                    parts.append("{}{}m".format(CSI, SGR.get(style, "0")))
+                    self._pen = style
+                parts.append(char)
+        return "".join(parts)
+
+    def key(self, char):
+        """
+        Run the action bound to `char`, False if it asks to quit
+        """
+        action = self._keys.get(char)
+        if action == "exit_clicked":
+            return False
+        if action is not None:
+            getattr(self.tomato, action)()
+        return True
+
+    def run(self):
+        import termios
+        import tty
+
+        stdin = sys.stdin.fileno()
+        saved = termios.tcgetattr(stdin)
+        # WHY a pipe: a resize signal wakes select() instead of being retried
+        wakeup, notify = os.pipe()
+        os.set_blocking(notify, False)
+        previous_wakeup = signal.set_wakeup_fd(notify)
+        signal.signal(signal.SIGWINCH, lambda *_: None)
+        clock = self.tomato.clock
+        # Alternate screen, cursor hidden
+        self._out.write(CSI + "?1049h" + CSI + "?25l")
+        try:
+            tty.setcbreak(stdin)
+            self.repaint()
+            running = True
+            while running:
+                deadline = self.draw()
+                timeout = None
+                if deadline is not None:
+                    timeout = max(0, deadline - clock.now())
+                    if clock.max_wait is not None:
+                        timeout = min(timeout, clock.max_wait)
+                    timeout /= NS_PER_SECOND
+                ready, _, _ = select.select([stdin, wakeup], [], [], timeout)
+                if wakeup in ready:
+                    os.read(wakeup, 512)
+                    self.repaint()
+                if stdin in ready:
+                    for char in os.read(stdin, 64).decode("utf-8", "replace"):
+                        running = running and self.key(char)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            termios.tcsetattr(stdin, termios.TCSADRAIN, saved)
+            signal.set_wakeup_fd(previous_wakeup)
+            signal.signal(signal.SIGWINCH, signal.SIG_DFL)
+            os.close(wakeup)
+            os.close(notify)
+            self._out.write(CSI + "0m" + CSI + "?25h" + CSI + "?1049l")
+            self._out.flush()
+            if self._status is not None:
+                self._status.close()
+
+    def shutdown(self, timeout=None):
+        self.tomato.shutdown(timeout)
+        if self._checkpointer is not None:
+            from pydoro.pydoro_core.snapshot import FLUSH_SECONDS
+
+            self._checkpointer.flush(FLUSH_SECONDS)
+
+
+def run(configs):
+    if not sys.stdin.isatty():
+        print("pydoro: --plain needs a terminal", file=sys.stderr)
+        sys.exit(2)
+    try:
+        import termios  # noqa: F401
+    except ImportError:
+        print("pydoro: --plain is not supported on this platform", file=sys.stderr)
+        sys.exit(2)
+    ui = PlainInterface(configs)
+    ui.run()
+    # WHY: let hooks of the last transitions finish before exiting
+    ui.shutdown(configs.cmd_timeout_seconds or None)
+    if configs.exit_cmd:
+        import subprocess
+
+        subprocess.run(configs.exit_cmd)
@@ -0,0 +1,106 @@
+"""
+Fast-forward the pydoro state machine on a virtual clock
+
+    python -m pydoro.pydoro_core.simulation [--tomatoes N] [--pauses N]
+                                            [--pause-seconds S] [--start-delay S]
+
+Runs whole work / break schedules without waiting, checks that every period
+ends exactly when it should (pauses included) and reports how fast the state
+machine transitions.
+"""
+
+import argparse
+from timeit import default_timer
+
+from pydoro.pydoro_core.clock import NS_PER_SECOND, VirtualClock, to_ns
+from pydoro.pydoro_core.config import Configuration
+from pydoro.pydoro_core.tomato import Tomato
+
+# Commands that must not run thousands of times during a simulation
+TRIGGERS = (
+    "work_state_cmd",
+    "work_paused_state_cmd",
+    "work_resumed_state_cmd",
+    "small_break_state_cmd",
+    "long_break_state_cmd",
+    "hook_process_cmd",
+)
+
+
+class Simulation:
+    """
+    Drives a Tomato on a VirtualClock
+
+    Every running period is paused `pauses` times for `pause_seconds` each,
+    and the user takes `start_delay` seconds to press start when waiting.
+    """
+
+    def __init__(self, configs, pauses=0, pause_seconds=0, start_delay=0):
+        for trigger in TRIGGERS:
+            setattr(configs, trigger, [])
+        configs.no_sound = True
+        configs.history = False
+        self.clock = VirtualClock()
+        self.tomato = Tomato(configs, self.clock)
+        self.tomato.add_listener(self._count)
+        self.pauses = pauses
+        self.pause_ns = to_ns(pause_seconds)
+        self.start_delay_ns = to_ns(start_delay)
+        self.transitions = 0
+        # Total nanoseconds periods ended away from their expected instant
+        self.drift = 0
+
+    def _count(self, _):
+        self.transitions += 1
+
+    def run(self, tomatoes):
+        tomato = self.tomato
+        tomato.start()
+        while tomato.tomatoes < tomatoes:
+            if tomato.next_transition is None:
+                self.clock.advance(self.start_delay_ns)
+                tomato.start()
+            else:
+                self._run_period()
+
+    def _run_period(self):
+        tomato, clock = self.tomato, self.clock
+        expected_end = tomato.next_transition + self.pauses * self.pause_ns
+        for pauses_left in range(self.pauses, 0, -1):
+            clock.advance((tomato.next_transition - clock.now()) // (pauses_left + 1))
+            tomato.pause()
+            clock.advance(self.pause_ns)
+            tomato.start()
+        clock.advance_to(tomato.next_transition)
+        self.drift += abs(clock.now() - expected_end)
+        tomato.update()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        "pydoro.pydoro_core.simulation", description="Simulate pydoro schedules"
+    )
+    parser.add_argument("--tomatoes", type=int, default=10000)
+    parser.add_argument("--pauses", type=int, default=0, help="pauses per period")
+    parser.add_argument("--pause-seconds", type=float, default=60)
+    parser.add_argument("--start-delay", type=float, default=5)
+    args = parser.parse_args()
+
+    simulation = Simulation(
+        Configuration([]), args.pauses, args.pause_seconds, args.start_delay
+    )
+    started = default_timer()
+    simulation.run(args.tomatoes)
+    elapsed = default_timer() - started
+
+    print("tomatoes       : {}".format(simulation.tomato.tomatoes))
+    print("transitions    : {}".format(simulation.transitions))
+    hours = simulation.clock.now() / NS_PER_SECOND / 3600
+    print("virtual time   : {:.1f}h".format(hours))
+    print("wall time      : {:.3f}s".format(elapsed))
+    print("transitions/s  : {:.0f}".format(simulation.transitions / elapsed))
+    print("drift          : {}ns".format(simulation.drift))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Crash-safe timer snapshot
+
+After every state transition the timer is packed into one small fixed-size
+record. A background thread writes it to a temporary file and renames that
+over the state file, so the file always holds a whole snapshot, old or
+new. Only the latest snapshot is kept: transitions coming faster than the
+disk are folded into a single write. Ticks never write.
+
+The next launch resumes from it. A running period is saved with its
+wall-clock deadline, so time spent while pydoro was not running (closed
+terminal, reboot, suspend) counts as elapsed.
+
+Layout (little-endian, 48 bytes):
+    magic       4s   b"PDT1"
+    state       u8   history.STATE_CODES
+    after       u8   running state the waiting state leads to, 255 if none
+    tomatoes    u32
+    remainder   i64  nanoseconds left in a paused period
+    time_period i64  nanoseconds in the current period
+    deadline    i64  wall-clock nanoseconds the running period ends, 0 if none
+    saved       i64  wall-clock nanoseconds the snapshot was taken
+    crc         u32  of all the above
+"""
+
+import os
+import struct
+import threading
+import zlib
+from collections import namedtuple
+
+from pydoro.pydoro_core import metrics
+from pydoro.pydoro_core.clock import perf_counter_ns, time_ns
+from pydoro.pydoro_core.history import STATE_CODES, STATE_NAMES
+
+MAGIC = b"PDT1"
+RECORD = struct.Struct("<4sBBxxIqqqq")
+CRC = struct.Struct("<I")
+SIZE = RECORD.size + CRC.size
+NO_STATE = 255
+# Longest wait at exit for the last snapshot to reach the disk
+FLUSH_SECONDS = 2
+
+# Names of states, `deadline` in wall-clock nanoseconds or None
+Snapshot = namedtuple("Snapshot", "state after tomatoes remainder time_period deadline")
+
+
+def pack(snapshot):
+    data = RECORD.pack(
+        MAGIC,
+        STATE_CODES[snapshot.state],
+        STATE_CODES[snapshot.after] if snapshot.after else NO_STATE,
+        snapshot.tomatoes,
+        snapshot.remainder,
+        snapshot.time_period,
+        snapshot.deadline or 0,
+        time_ns(),
+    )
+    return data + CRC.pack(zlib.crc32(data))
+
+
+def unpack(data):
+    """
+    Snapshot stored in `data`, None if it is not a valid one
+    """
+    if len(data) != SIZE:
+        return None
+    payload = data[: RECORD.size]
+    if CRC.unpack_from(data, RECORD.size)[0] != zlib.crc32(payload):
+        return None
+    magic, state, after, tomatoes, remainder, period, deadline, _ = RECORD.unpack(
+        payload
+    )
+    if magic != MAGIC or state not in STATE_NAMES:
+        return None
+    return Snapshot(
+        STATE_NAMES[state],
+        STATE_NAMES.get(after),
+        tomatoes,
+        remainder,
+        period,
+        deadline or None,
+    )
+
+
+class Checkpointer:
+    """
+    Keeps the state file at `path` in step with a timer
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._pending = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._thread = None
+
+    def load(self):
+        """
+        Last snapshot saved, None if there is none or it is unreadable
+        """
+        try:
+            with open(self._path, "rb") as f:
+                return unpack(f.read(SIZE + 1))
+        except OSError:
+            return None
+
+    def attach(self, tomato):
+        """
+        Restore `tomato` from the last snapshot, then keep saving it
+        """
+        snapshot = self.load()
+        if snapshot is not None:
+            tomato.restore(snapshot)
+        tomato.add_listener(self.save)
+
+    def save(self, tomato):
+        """
+        Tomato listener, queues a snapshot of the state it just entered
+        """
+        data = pack(tomato.checkpoint())
+        with self._lock:
+            self._pending = data
+            self._idle.clear()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def flush(self, timeout=None):
+        """
+        Wait until the latest snapshot is on disk
+        """
+        self._idle.wait(timeout)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            with self._lock:
+                data, self._pending = self._pending, None
+            if data is not None:
+                started = perf_counter_ns()
+                self._write(data)
+                metrics.record("checkpoint", perf_counter_ns() - started)
+            with self._lock:
+                if self._pending is None:
+                    self._idle.set()
+
+    def _write(self, data):
+        tmp_path = self._path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self._path)), exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._path)
+        except OSError:
+            # WHY: a lost snapshot only costs the resume, never the timer
+            pass
@@ -4,13 +4,37 @@ https://github.com/TaylorSMarks/playsound
 playsound.py - For playing audio file, Copyright (c) 2016 Taylor Marks
 MIT License
 ----
-I've added async play for linux using a thread, changed names to be more pythonic
+I've added async play for linux using a worker thread, changed names to be more pythonic
 I've also added a thin wrapper around pygame as well
+
+A sound is a path, a URL or TONE_PREFIX followed by a tones.py pattern.
+Tones are rendered once and handed to the backend from memory.
 """
 
-from platform import system
+import collections
+import os
+import queue
+import sys
+import threading
+import time
+
+from pydoro.pydoro_core import metrics
+from pydoro.pydoro_core.clock import monotonic_ns, to_ns
+
+# Backend chosen on Linux is remembered here so later launches skip probing
+BACKEND_CACHE_FILE = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "pydoro",
+    "audio_backend",
+)
 
-system = system()
+# Sound names starting with this are synthesized tones, see tones.py
+TONE_PREFIX = "tone:"
+
+# Alarms sounding at the same time at most
+MAX_VOICES = 2
+# Assumed length of a sound whose length cannot be read from its header
+DEFAULT_SOUND_SECONDS = 2.0
 
 
 class PlayException(Exception):
@@ -86,98 +110,504 @@ def _play_sound_osx(sound, block=True):
         sleep(nssound.duration())
 
 
-def _play_sound_nix_blocking(sound):
+class _AudioWorker:
+    """
+    Long-lived thread owning an audio backend
+
+    The backend is initialized once on the worker thread and every file is
+    decoded once, then kept in memory keyed by path and modification time.
+    Play requests are served from a queue so callers never wait for it.
+    If the backend fails to initialize, `fallback` is used instead.
+    """
+
+    def __init__(self, backend, fallback=None):
+        self._backend = backend
+        self._fallback = fallback
+        self._queue = None
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def play(self, sound, block=True):
+        request = _PlayRequest(sound, block)
+        self._ensure_started()
+        self._queue.put(request)
+        if block:
+            request.done.wait()
+            if request.error is not None:
+                raise request.error
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._queue is not None:
+                return
+            self._queue = queue.Queue()
+            threading.Thread(target=self._run, daemon=True).start()
+
+    def preload(self, sound):
+        """
+        Decode `sound` now and forget every other cached sound
+
+        Does nothing until the first play, the backend is only initialized
+        once a sound is needed.
+        """
+        if self._queue is None:
+            return
+        self._queue.put(_PlayRequest(sound, block=False, play=False))
+
+    def _run(self):
+        initialized = False
+        while True:
+            request = self._queue.get()
+            try:
+                if not initialized:
+                    self._init_backend()
+                    initialized = True
+                decoded = self._load(request.sound)
+                if request.play:
+                    started = monotonic_ns() - request.created
+                    metrics.record("audio_start", started)
+                    self._backend.play(decoded, request.block)
+                else:
+                    key = _cache_key(request.sound)
+                    for other in [other for other in self._cache if other != key]:
+                        self._backend.release(self._cache.pop(other)[1])
+            except Exception as e:
+                request.error = e
+            request.done.set()
+
+    def _init_backend(self):
+        try:
+            self._backend.init()
+        except Exception:
+            if self._fallback is None:
+                raise
+            # WHY: installed is not working, pygame may lack a mixer or a device
+            self._backend, self._fallback = self._fallback, None
+            _forget_backend()
+            self._backend.init()
+
+    def _load(self, sound):
+        if sound.startswith(("http://", "https://")):
+            return self._backend.load(sound)
+        key = _cache_key(sound)
+        if sound.startswith(TONE_PREFIX):
+            cached = self._cache.get(key)
+            if cached is None:
+                from pydoro.pydoro_core import tones
+
+                data = tones.wav(sound[len(TONE_PREFIX) :])
+                cached = self._cache[key] = (None, self._backend.load_wav(data))
+            return cached[1]
+        mtime = os.stat(key).st_mtime_ns
+        cached = self._cache.get(key)
+        if cached is None or cached[0] != mtime:
+            if cached is not None:
+                self._backend.release(cached[1])
+            cached = self._cache[key] = (mtime, self._backend.load(key))
+        return cached[1]
+
+
+def _cache_key(sound):
+    if sound.startswith(TONE_PREFIX):
+        return sound
+    return os.path.abspath(sound)
+
+
+class _PlayRequest:
+    def __init__(self, sound, block, play=True):
+        self.sound = sound
+        self.block = block
+        self.play = play
+        self.created = monotonic_ns()
+        self.done = threading.Event()
+        self.error = None
+
+
+class _GstBackend:
     """Play a sound using GStreamer.
     Inspired by this:
     https://gstreamer.freedesktop.org/documentation/tutorials/playback/playbin-usage.html
+
+    A single playbin is reused for every alarm. GStreamer decodes while it
+    streams, so what gets cached is the resolved URI, the file itself stays
+    in the OS page cache.
     """
-    # pathname2url escapes non-URL-safe characters
-    import os
 
-    try:
+    def __init__(self):
+        # In-memory files behind the URIs of loaded tones, by URI
+        self._tone_fds = {}
+
+    def init(self):
+        import gi
+
+        gi.require_version("Gst", "1.0")
+        from gi.repository import Gst
+
+        Gst.init(None)
+        self._gst = Gst
+        self._playbin = Gst.ElementFactory.make("playbin", "playbin")
+
+    def load(self, sound):
+        # pathname2url escapes non-URL-safe characters
         from urllib.request import pathname2url
-    except ImportError:
-        # python 2
-        from urllib import pathname2url
 
-    import gi
+        if sound.startswith(("http://", "https://")):
+            return sound
+        return "file://" + pathname2url(sound)
+
+    def load_wav(self, data):
+        # WHY memfd: playbin wants a URI, an anonymous in-memory file has one
+        if hasattr(os, "memfd_create"):
+            fd = os.memfd_create("pydoro-tone")
+        else:
+            # python < 3.8, an unlinked temporary file has such a URI too
+            import tempfile
+
+            fd, path = tempfile.mkstemp(prefix="pydoro-tone-")
+            os.unlink(path)
+        os.write(fd, data)
+        uri = "file:///proc/self/fd/{}".format(fd)
+        self._tone_fds[uri] = fd
+        return uri
+
+    def release(self, uri):
+        fd = self._tone_fds.pop(uri, None)
+        if fd is not None:
+            os.close(fd)
+
+    def play(self, uri, block):
+        Gst = self._gst
+        # WHY: going to NULL rewinds and flushes messages of the last play
+        self._playbin.set_state(Gst.State.NULL)
+        self._playbin.props.uri = uri
+
+        set_result = self._playbin.set_state(Gst.State.PLAYING)
+        if set_result != Gst.StateChangeReturn.ASYNC:
+            raise PlayException("playbin.set_state returned " + repr(set_result))
+
+        if block:
+            bus = self._playbin.get_bus()
+            bus.poll(Gst.MessageType.EOS, Gst.CLOCK_TIME_NONE)
+            self._playbin.set_state(Gst.State.NULL)
+
+
+class _PygameBackend:
+    """
+    Thin wrapper around pygame's mixer, sounds are fully decoded into memory
+    """
 
-    gi.require_version("Gst", "1.0")
-    from gi.repository import Gst
+    def init(self):
+        # WHY: pygame prints a banner on import unless told otherwise
+        os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+        from pygame import mixer
 
-    Gst.init(None)
+        mixer.init()
+        self._mixer = mixer
 
-    playbin = Gst.ElementFactory.make("playbin", "playbin")
-    if sound.startswith(("http://", "https://")):
-        playbin.props.uri = sound
-    else:
-        playbin.props.uri = "file://" + pathname2url(os.path.abspath(sound))
+    def load(self, sound):
+        return self._mixer.Sound(sound)
 
-    set_result = playbin.set_state(Gst.State.PLAYING)
-    if set_result != Gst.StateChangeReturn.ASYNC:
-        raise PlayException("playbin.set_state returned " + repr(set_result))
+    def load_wav(self, data):
+        import io
 
-    bus = playbin.get_bus()
-    bus.poll(Gst.MessageType.EOS, Gst.CLOCK_TIME_NONE)
-    playbin.set_state(Gst.State.NULL)
+        return self._mixer.Sound(file=io.BytesIO(data))
 
+    def release(self, decoded):
+        pass
 
-def _play_sound_nix_no_except(sound):
-    # noinspection PyBroadException
-    try:
-        _play_sound_nix(sound)
-    except:
+    def play(self, decoded, block):
+        channel = decoded.play()
+        if block and channel is not None:
+            while channel.get_busy():
+                time.sleep(0.1)
+
+
+class _SinkBackend:
+    """
+    Pipes WAV data into a command such as `aplay -q`, one run per sound
+
+    Files are memory-mapped instead of read, so they are never copied
+    into pydoro's memory and an unchanged file is not read again.
+    """
+
+    def __init__(self, cmd):
+        self._cmd = cmd
+
+    def init(self):
         pass
 
+    def load(self, sound):
+        import mmap
 
-def _play_sound_nix(sound, block=True):
-    if block:
-        _play_sound_nix_blocking(sound)
-        return
+        with open(sound, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def load_wav(self, data):
+        return data
+
+    def release(self, data):
+        if not isinstance(data, bytes):
+            data.close()
 
-    from threading import Thread
+    def play(self, data, block):
+        import subprocess
 
-    thread = Thread(target=_play_sound_nix_no_except, args=(sound,), daemon=True)
-    thread.start()
+        process = subprocess.Popen(
+            self._cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            process.stdin.write(data)
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        # WHY always: reaps the command, the worker thread is the one waiting
+        process.wait()
 
 
-def _play_sound_pygame_blocking(sound):
-    from pygame import mixer
-    import time
+_gst_worker = _AudioWorker(_GstBackend())
+_pygame_worker = _AudioWorker(_PygameBackend(), _GstBackend())
+_sink_cmd = None
+_sink_worker = None
 
-    mixer.init()
-    mixer.music.load(sound)
-    mixer.music.play()
 
-    while mixer.music.get_busy():
-        time.sleep(0.1)
+def _play_sound_nix(sound, block=True):
+    _gst_worker.play(sound, block)
 
 
 def _play_sound_pygame(sound, block=True):
-    if block:
-        _play_sound_pygame_blocking(sound)
-        return
+    _pygame_worker.play(sound, block)
+
+
+def _play_sound_sink(sound, block=True):
+    _sink_worker.play(sound, block)
+
 
-    from threading import Thread
+_WORKERS = {_play_sound_nix: _gst_worker, _play_sound_pygame: _pygame_worker}
 
-    thread = Thread(target=_play_sound_pygame_blocking, args=(sound,), daemon=True)
-    thread.start()
 
+def _probe_nix():
+    """
+    Pick a Linux backend without importing it and remember the choice
+    For linux this will try following libraries
+    1) if pygame can be found use it
+    2) if pygame cannot be found use PyGObject
+
+    The cache holds the backend name and the module file it was found at,
+    it is trusted as long as that file still exists.
+    """
+    try:
+        with open(BACKEND_CACHE_FILE) as f:
+            name, origin = f.read().splitlines()
+        if os.path.exists(origin):
+            return name
+    except (OSError, ValueError):
+        pass
+
+    from importlib.util import find_spec
 
-if system == "Windows":
-    play = _play_sound_win
-elif system == "Darwin":
-    play = _play_sound_osx
-else:
-    # For linux this will try following libraries
-    # 1) if pygame can be imported use it
-    # 2) if pygame cannot be imported use PyGObject
+    name, spec = "pygame", find_spec("pygame")
+    if spec is None:
+        name, spec = "gst", find_spec("gi")
+    if spec is None or not spec.origin:
+        # Nothing usable is installed, do not cache so it is probed again
+        return "gst"
+
+    try:
+        os.makedirs(os.path.dirname(BACKEND_CACHE_FILE), exist_ok=True)
+        with open(BACKEND_CACHE_FILE, "w") as f:
+            f.write(name + "\n" + spec.origin + "\n")
+    except OSError:
+        pass
+    return name
+
+
+def _forget_backend():
+    """
+    Drop the remembered Linux backend, the next launch probes again
+    """
     try:
-        import pygame as try_pygame
+        os.remove(BACKEND_CACHE_FILE)
+    except OSError:
+        pass
+
+
+_backend = None
+
+
+def _select_backend():
+    if sys.platform == "win32":
+        return _play_sound_win
+    if sys.platform == "darwin":
+        return _play_sound_osx
+    if _probe_nix() == "pygame":
+        return _play_sound_pygame
+    return _play_sound_nix
+
+
+def play(sound, block=True):
+    """
+    Play `sound`, the backend is only chosen and imported on first use
+    """
+    global _backend
+    if _backend is None:
+        _backend = _select_backend()
+    if sound.startswith(TONE_PREFIX) and _backend in (
+        _play_sound_win,
+        _play_sound_osx,
+    ):
+        sound = _tone_file(sound)
+    _backend(sound, block)
+
+
+_tone_files = {}
+
+
+def _tone_file(sound):
+    """
+    Path of a file holding the tone `sound`, for backends that only play
+    files. Written once per run and removed at exit.
+    """
+    path = _tone_files.get(sound)
+    if path is None:
+        import tempfile
+
+        from pydoro.pydoro_core import tones
+
+        if not _tone_files:
+            import atexit
+
+            atexit.register(_remove_tone_files)
+        fd, path = tempfile.mkstemp(prefix="pydoro-", suffix=".wav")
+        with os.fdopen(fd, "wb") as f:
+            f.write(tones.wav(sound[len(TONE_PREFIX) :]))
+        _tone_files[sound] = path
+    return path
+
+
+def _remove_tone_files():
+    for path in _tone_files.values():
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    _tone_files.clear()
+
+
+def use_sink(cmd):
+    """
+    Play every sound by piping it into the command `cmd`, or through the
+    platform backend again if `cmd` is empty
+    """
+    global _backend, _sink_cmd, _sink_worker
+    if not cmd:
+        if _backend is _play_sound_sink:
+            _backend = None
+        return
+    if cmd != _sink_cmd or _backend is not _play_sound_sink:
+        _sink_cmd = cmd
+        _sink_worker = _AudioWorker(_SinkBackend(cmd))
+        _backend = _play_sound_sink
+
+
+def _duration(sound):
+    """
+    Seconds `sound` plays for, read from the header of WAV files
+    """
+    if sound.startswith(TONE_PREFIX):
+        from pydoro.pydoro_core import tones
+
+        return tones.duration(sound[len(TONE_PREFIX) :])
+    if sound.lower().endswith(".wav"):
+        import wave
+
+        try:
+            with wave.open(sound) as f:
+                return f.getnframes() / f.getframerate()
+        except (OSError, EOFError, wave.Error):
+            pass
+    return DEFAULT_SOUND_SECONDS
+
+
+class VoicePool:
+    """
+    Plays alarms without letting them pile up
+
+    At most `voices` alarms sound at once. An alarm asked for while the
+    same sound still plays is coalesced into it, one asked for while every
+    voice is busy is dropped. Outcomes are counted in `stats` and in the
+    alarms_played, alarms_coalesced and alarms_dropped metrics.
+    """
+
+    def __init__(self, voices=MAX_VOICES, player=None, clock=monotonic_ns):
+        self._voices = voices
+        self._player = player
+        self._clock = clock
+        # (end, sound) of every alarm that may still be sounding
+        self._playing = []
+        self._durations = {}
+        self._lock = threading.Lock()
+        self.stats = collections.Counter()
+
+    def play(self, sound):
+        now = self._clock()
+        with self._lock:
+            self._playing = [(end, s) for end, s in self._playing if end > now]
+            if any(s == sound for _, s in self._playing):
+                outcome = "coalesced"
+            elif len(self._playing) >= self._voices:
+                outcome = "dropped"
+            else:
+                outcome = "played"
+                self._playing.append((now + self._length(sound), sound))
+            self.stats[outcome] += 1
+        metrics.count("alarms_" + outcome)
+        if outcome == "played":
+            if self._player is not None:
+                self._player(sound)
+            else:
+                play(sound, block=False)
+
+    def _length(self, sound):
+        length = self._durations.get(sound)
+        if length is None:
+            length = self._durations[sound] = to_ns(_duration(sound))
+        return length
+
+
+_alarms = VoicePool()
+
+
+def alarm(sound):
+    """
+    Play `sound` in the background through the alarm voice pool
+    """
+    _alarms.play(sound)
+
+
+def alarm_stats():
+    """
+    Alarms played, coalesced and dropped so far
+    """
+    stats = _alarms.stats
+    return {outcome: stats[outcome] for outcome in ("played", "coalesced", "dropped")}
+
 
-        play = _play_sound_pygame
-        del try_pygame
-    except ImportError:
-        play = _play_sound_nix
+def preload(sound):
+    """
+    Decode `sound` ahead of its next play, dropping other cached sounds
+    Only the Linux backends and sinks keep a cache, elsewhere this does
+    nothing. Tones are rendered right away, no backend is chosen or
+    initialized before the first play.
+    """
+    if sound.startswith(TONE_PREFIX):
+        from pydoro.pydoro_core import tones
 
-del system
+        tones.wav(sound[len(TONE_PREFIX) :])
+    if _backend is None:
+        return
+    worker = _sink_worker if _backend is _play_sound_sink else _WORKERS.get(_backend)
+    if worker is not None:
+        worker.preload(sound)
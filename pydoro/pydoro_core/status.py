@@ -0,0 +1,137 @@
+"""
+Memory-mapped status file for status bars
+
+pydoro keeps a small fixed-layout file up to date in place, once per second
+at most and only when something changed. Status bar widgets map it and read
+it without talking to pydoro at all. Writers bump a sequence number to an
+odd value before writing and to the next even value after, so readers
+retry instead of seeing a half-written record.
+
+Layout (little-endian, 64 bytes):
+    magic     4s   b"PDS1"
+    sequence  u32
+    state     24s  state name, utf-8, NUL padded
+    remaining f64  seconds left in the current or paused period
+    deadline  f64  wall-clock time the running period ends, 0 if not running
+    tomatoes  u32
+    sets      u32
+    updated   f64  wall-clock time of the last update
+"""
+
+import mmap
+import os
+import struct
+import time
+from collections import namedtuple
+
+from pydoro.pydoro_core.control import runtime_file
+
+MAGIC = b"PDS1"
+SEQUENCE = struct.Struct("<I")
+BODY = struct.Struct("<24sddIId")
+SIZE = 64
+BODY_OFFSET = len(MAGIC) + SEQUENCE.size
+
+Status = namedtuple("Status", "state remaining deadline tomatoes sets updated")
+
+
+def status_path():
+    return runtime_file("pydoro.status", "PYDORO_STATUS_FILE")
+
+
+class StatusWriter:
+    def __init__(self, path=None):
+        self._path = path or status_path()
+        fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            os.ftruncate(fd, SIZE)
+            self._map = mmap.mmap(fd, SIZE)
+        finally:
+            os.close(fd)
+        self._map[: len(MAGIC)] = MAGIC
+        self._sequence = 0
+        SEQUENCE.pack_into(self._map, len(MAGIC), self._sequence)
+        self._published = None
+
+    def publish(self, tomato):
+        """
+        Write the state of `tomato` if what a reader would show changed
+        """
+        remaining = tomato.remaining
+        running = tomato.next_transition is not None
+        key = (tomato.state_name, int(remaining), running, tomato.tomatoes)
+        if key == self._published:
+            return
+        self._published = key
+        now = time.time()
+        body = BODY.pack(
+            tomato.state_name.encode("utf-8")[:24],
+            remaining,
+            now + remaining if running else 0.0,
+            tomato.tomatoes,
+            tomato.tomatoes // tomato.configs.tomatoes_per_set,
+            now,
+        )
+        self._sequence += 1
+        SEQUENCE.pack_into(self._map, len(MAGIC), self._sequence)
+        self._map[BODY_OFFSET : BODY_OFFSET + BODY.size] = body
+        self._sequence += 1
+        SEQUENCE.pack_into(self._map, len(MAGIC), self._sequence)
+
+    def close(self):
+        self._map.close()
+        try:
+            os.unlink(self._path)
+        except OSError:
+            pass
+
+
+class StatusReader:
+    def __init__(self, path=None):
+        with open(path or status_path(), "rb") as f:
+            self._map = mmap.mmap(f.fileno(), SIZE, access=mmap.ACCESS_READ)
+        if self._map[: len(MAGIC)] != MAGIC:
+            raise ValueError("not a pydoro status file")
+
+    def read(self):
+        """
+        Consistent snapshot of the status, spins while a write is under way
+        """
+        while True:
+            before = SEQUENCE.unpack_from(self._map, len(MAGIC))[0]
+            if before % 2:
+                continue
+            values = BODY.unpack_from(self._map, BODY_OFFSET)
+            if SEQUENCE.unpack_from(self._map, len(MAGIC))[0] == before:
+                break
+        state = values[0].rstrip(b"\0").decode("utf-8")
+        return Status(state, *values[1:])
+
+    def close(self):
+        self._map.close()
+
+
+def watch(interval=0.25):
+    """
+    `pydoro ctl watch`, prints a line each time the shown status changes
+    """
+    reader = StatusReader()
+    last = None
+    try:
+        while True:
+            status = reader.read()
+            remaining = status.remaining
+            if status.deadline:
+                remaining = max(status.deadline - time.time(), 0)
+            minutes, seconds = divmod(int(-(-remaining // 1)), 60)
+            line = "{} {:02}:{:02} tomatoes={} sets={}".format(
+                status.state, minutes, seconds, status.tomatoes, status.sets
+            )
+            if line != last:
+                print(line, flush=True)
+                last = line
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
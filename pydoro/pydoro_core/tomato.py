@@ -1,15 +1,15 @@
-import itertools
-import subprocess
+import functools
+import math
 import sys
-import os
 from enum import IntEnum
-from timeit import default_timer
 
 from pydoro.pydoro_core import sound
-from pydoro.pydoro_core.util import open_file_in_default_editor
+from pydoro.pydoro_core.clock import NS_PER_SECOND, RealClock, time_ns, to_ns
 from pydoro.pydoro_core.config import Configuration
-
-from prompt_toolkit.application.current import get_app
+from pydoro.pydoro_core.triggers import TriggerExecutor
+from pydoro.pydoro_core.hooks import HookProcess
+from pydoro.pydoro_core.snapshot import Snapshot
+from pydoro.pydoro_core.util import named_path
 
 SECONDS_PER_MIN = 60
 
@@ -148,377 +148,672 @@ TEXT = {
     Tasks.INTERMEDIATE: "",
 }
 
-PROGRESS = ["|#  |", "| # |", "|  #|", "| # |"]
-
+# Banner text of each task pre-split into the four task placeholder lines
+BANNERS = {
+    task: tuple(TEXT[task].splitlines()) or ("",) * len(PLACEHOLDER_TASK)
+    for task in Tasks
+}
 
-def cur_time():
-    return int(default_timer())
+PROGRESS = ["|#  |", "| # |", "|  #|", "| # |"]
+# Nanoseconds each progress spinner frame stays on screen, the spinner is
+# counted down with the clock so both change at the same instants
+PROGRESS_INTERVAL = to_ns(0.5)
+# Low-power mode hides the spinner and shows whole minutes only
+LOW_POWER_INTERVAL = to_ns(SECONDS_PER_MIN)
+
+
+def next_tick(now, remaining, interval):
+    """
+    Instant at which `remaining`, counted in whole `interval`s, next changes
+    """
+    return now + (remaining % interval or interval)
+
+
+class TimerRecord:
+    """
+    Everything that changes while one timer runs
+
+    States are shared singletons without any data of their own, they read
+    and update the record of the timer they are called for. Times are
+    clock nanoseconds: a running period ends at `deadline`, `remainder` is
+    what was left when it was last paused.
+    """
+
+    __slots__ = (
+        "deadline",
+        "remainder",
+        "time_period",
+        "last_alarm",
+        "alarms",
+        "after",
+    )
+
+    def __init__(self):
+        self.deadline = None
+        self.remainder = 0
+        self.time_period = 0
+        # Waiting state only: when the alarm last rang, how many times it
+        # did and the state that follows
+        self.last_alarm = None
+        self.alarms = 0
+        self.after = None
 
 
 class InitialState:
+    __slots__ = ()
     name = "initial"
+    task = Tasks.NO_TASK
+    status = TaskStatus.NONE
 
-    def __init__(self, tomato):
-        self._tomato = tomato
-        self._task = Tasks.NO_TASK
-        self._status = TaskStatus.NONE
-        self._started_at = 0
-        self._remainder = 0
-        self._time_period = 0
-        self._progress = itertools.cycle(PROGRESS)
-
-    def start(self):
-        self._tomato.play_alarm()
-        return WorkingState(self._tomato)
+    def start(self, tomato):
+        tomato.play_alarm()
+        return WORKING.begin(tomato)
 
-    def pause(self):
+    def pause(self, tomato):
         return self
 
-    def reset(self):
+    def reset(self, tomato):
         return self
 
-    @property
-    def remainder(self):
-        return self._remainder
+    def remainder(self, tomato):
+        return tomato.record.remainder / NS_PER_SECOND
 
-    @property
-    def next_state(self):
+    def next_state(self, tomato):
         return self
 
-    @property
-    def time_period(self):
-        return self._time_period
-
-    @property
-    def time_remaining(self):
+    def time_remaining(self, tomato):
         return "Press [start]"
 
-    @property
-    def task(self):
-        return self._task
+    def done(self, tomato):
+        return False
 
-    @property
-    def status(self):
-        return self._status
+    def next_change(self, tomato):
+        """
+        Instant (clock nanoseconds) at which the rendered output or the
+        state itself can next change, None if only user input can
+        """
+        return None
 
-    @property
-    def done(self):
-        return False
+    def next_transition(self, tomato):
+        """
+        Instant (clock nanoseconds) at which this state will be done,
+        None if it waits for user input
+        """
+        return None
 
-    def _format_time(self, remainder):
-        minutes, seconds = divmod(int(remainder), SECONDS_PER_MIN)
+    @staticmethod
+    def _next_tick(tomato, end):
+        """
+        Next instant the shown time can change, the spinner (or the whole
+        minutes in low-power mode) being what changes most often
+        """
+        now = tomato.clock.now()
+        if end <= now:
+            return now
+        if tomato.configs.low_power:
+            return next_tick(now, end - now, LOW_POWER_INTERVAL)
+        return next_tick(now, end - now, PROGRESS_INTERVAL)
+
+    def _format_time(self, tomato, remainder):
+        if tomato.configs.low_power:
+            whole_minutes = -(-remainder // LOW_POWER_INTERVAL)
+            return "{}min remaining".format(whole_minutes)
+        # WHY ceil: show 25min 0s for the whole first second, not 24min 59s
+        whole_seconds = -(-remainder // NS_PER_SECOND)
+        minutes, seconds = divmod(whole_seconds, SECONDS_PER_MIN)
         if self.status == TaskStatus.STARTED:
-            progress = next(self._progress) + " "
+            frame = -(-remainder // PROGRESS_INTERVAL) % len(PROGRESS)
+            progress = PROGRESS[frame] + " "
         else:
             progress = ""
 
         return "{}{:00}min {:00}s remaining".format(progress, minutes, seconds)
 
-    def _calc_remainder(self):
-        cur = cur_time()
-        self._remainder = max(self._remainder - (cur - self._started_at), 0)
-        self._started_at = cur
-
 
 class IntermediateState(InitialState):
+    __slots__ = ()
     name = "waiting"
-
-    def __init__(self, tomato):
-        super().__init__(tomato)
-        self._task = Tasks.INTERMEDIATE
-        self._status = TaskStatus.LIMBO
-        self._next_factory = None
-        self._last_alarm_time = 0
-        self._sound()
-
-    def _sound(self):
-        if cur_time() - self._last_alarm_time > self._tomato.configs.alarm_seconds:
-            self._tomato.play_alarm()
-            self._last_alarm_time = cur_time()
-
-    def start(self):
-        return self._next_factory(self._tomato)
-
-    @property
-    def time_remaining(self):
-        self._sound()
-        return "Press [start] to continue with " + self._next_factory.name
-
-    @property
-    def done(self):
-        return False
+    task = Tasks.INTERMEDIATE
+    status = TaskStatus.LIMBO
+
+    def wait_for(self, tomato, after):
+        """
+        Enter this state, `after` is the running state started next
+        """
+        record = tomato.record
+        record.after = after
+        record.last_alarm = None
+        record.alarms = 0
+        record.remainder = 0
+        self._sound(tomato)
+        return self
 
     @staticmethod
-    def transition_to(next_state_factory, tomato):
-        state = IntermediateState(tomato)
-        state._next_factory = next_state_factory
-        return state
-
-
-class WorkingState(InitialState):
-    name = "work"
-
-    def __init__(self, tomato):
-        super().__init__(tomato)
-        self._time_period = self._remainder = int(
-            self._tomato.configs.work_minutes * SECONDS_PER_MIN
-        )
-        self._task = Tasks.WORK
-        self._status = TaskStatus.STARTED
-        self._started_at = cur_time()
-        if self._tomato.configs.work_state_cmd:
-            subprocess.run(self._tomato.configs.work_state_cmd)
-
-    def start(self):
+    def _next_alarm(tomato):
+        """
+        Instant the alarm rings again
+
+        Every repeat waits `alarm_backoff` times longer than the one before,
+        up to `alarm_max_seconds`, so a timer left waiting for hours does
+        not keep ringing every few seconds.
+        """
+        configs = tomato.configs
+        record = tomato.record
+        if record.last_alarm is None:
+            # Not rung yet in this state, e.g. right after a restore
+            return tomato.clock.now()
+        longest = max(configs.alarm_max_seconds, configs.alarm_seconds)
+        repeats = record.alarms - 1
+        if configs.alarm_backoff > 1:
+            # WHY log: stop growing at the longest wait, a large power of the
+            # back-off would overflow before being clamped
+            growth = math.log(longest / configs.alarm_seconds, configs.alarm_backoff)
+            repeats = min(repeats, growth)
+        seconds = configs.alarm_seconds * configs.alarm_backoff**repeats
+        return record.last_alarm + to_ns(min(seconds, longest))
+
+    def _sound(self, tomato):
+        record = tomato.record
+        now = tomato.clock.now()
+        if now >= self._next_alarm(tomato):
+            tomato.play_alarm()
+            record.last_alarm = now
+            record.alarms += 1
+
+    def start(self, tomato):
+        return tomato.record.after.begin(tomato)
+
+    def time_remaining(self, tomato):
+        self._sound(tomato)
+        return "Press [start] to continue with " + tomato.record.after.name
+
+    def next_change(self, tomato):
+        if tomato.configs.no_sound:
+            return None
+        return self._next_alarm(tomato)
+
+
+class RunningState(InitialState):
+    """
+    A period counting down to its deadline
+    """
+
+    __slots__ = ()
+    status = TaskStatus.STARTED
+    # Names of the config setting with the period's length and of its trigger
+    minutes = None
+    trigger = None
+
+    def begin(self, tomato):
+        """
+        Enter this state for a whole new period
+        """
+        minutes = getattr(tomato.configs, self.minutes)
+        tomato.record.time_period = to_ns(minutes * SECONDS_PER_MIN)
+        self.reset(tomato)
+        tomato.run_trigger(self.trigger)
         return self
 
-    @property
-    def time_remaining(self):
-        self._calc_remainder()
-        if self._tomato.configs.no_clock:
-            return ""
-        return self._format_time(self._remainder)
-
-    @property
-    def next_state(self):
-        self._tomato.tomatoes += 1
-        if self._tomato.tomatoes % self._tomato.configs.tomatoes_per_set == 0:
-            return IntermediateState.transition_to(LongBreakState, self._tomato)
-        return IntermediateState.transition_to(SmallBreakState, self._tomato)
-
-    def pause(self):
-        return WorkPausedState.return_to(self._tomato, self)
-
-    def reset(self):
-        self._remainder = self.time_period
+    def resume(self, tomato):
+        record = tomato.record
+        record.deadline = tomato.clock.now() + record.remainder
         return self
 
-    @property
-    def done(self):
-        return self._remainder <= 0
+    def start(self, tomato):
+        return self
 
+    def reset(self, tomato):
+        record = tomato.record
+        record.remainder = record.time_period
+        record.deadline = tomato.clock.now() + record.time_period
+        return self
 
-class WorkPausedState(InitialState):
-    name = "work paused"
+    def _remaining(self, tomato):
+        """
+        Nanoseconds left, derived from the deadline so nothing accumulates
+        """
+        return max(tomato.record.deadline - tomato.clock.now(), 0)
 
-    def __init__(self, tomato):
-        super().__init__(tomato)
-        self._prev = None
-        self._task = Tasks.WORK
-        self._status = TaskStatus.PAUSED
-        if self._tomato.configs.work_paused_state_cmd:
-            subprocess.run(self._tomato.configs.work_paused_state_cmd)
+    def remainder(self, tomato):
+        return self._remaining(tomato) / NS_PER_SECOND
 
-    def start(self):
-        if self._tomato.configs.work_resumed_state_cmd:
-            subprocess.run(self._tomato.configs.work_resumed_state_cmd)
-        self._prev._started_at = cur_time()
-        return self._prev
+    def time_remaining(self, tomato):
+        return self._format_time(tomato, self._remaining(tomato))
 
-    def reset(self):
-        self._prev._remainder = self._prev.time_period
-        return self
+    def done(self, tomato):
+        return tomato.clock.now() >= tomato.record.deadline
 
-    @property
-    def time_remaining(self):
-        return self._format_time(self._prev.remainder)
+    def next_transition(self, tomato):
+        return tomato.record.deadline
 
-    @staticmethod
-    def return_to(tomato, state):
-        cur_state = WorkPausedState(tomato)
-        cur_state._prev = state
-        return cur_state
+    def next_change(self, tomato):
+        return self._next_tick(tomato, tomato.record.deadline)
 
-    @property
-    def done(self):
-        return False
 
+class WorkingState(RunningState):
+    __slots__ = ()
+    name = "work"
+    task = Tasks.WORK
+    minutes = "work_minutes"
+    trigger = "work_state_cmd"
 
-class SmallBreakState(InitialState):
-    name = "small break"
+    def time_remaining(self, tomato):
+        if tomato.configs.no_clock:
+            return ""
+        return super().time_remaining(tomato)
 
-    def __init__(self, tomato):
-        super().__init__(tomato)
-        self._time_period = self._remainder = int(
-            self._tomato.configs.small_break_minutes * SECONDS_PER_MIN
-        )
-        self._task = Tasks.SMALL_BREAK
-        self._status = TaskStatus.STARTED
-        self._started_at = cur_time()
-        if self._tomato.configs.small_break_state_cmd:
-            subprocess.run(self._tomato.configs.small_break_state_cmd)
+    def next_state(self, tomato):
+        tomato.tomatoes += 1
+        if tomato.tomatoes % tomato.configs.tomatoes_per_set == 0:
+            return WAITING.wait_for(tomato, LONG_BREAK)
+        return WAITING.wait_for(tomato, SMALL_BREAK)
 
-    def start(self):
-        return self
+    def pause(self, tomato):
+        tomato.record.remainder = self._remaining(tomato)
+        tomato.run_trigger("work_paused_state_cmd")
+        return WORK_PAUSED
 
-    @property
-    def time_remaining(self):
-        self._calc_remainder()
+    def next_change(self, tomato):
+        if tomato.configs.no_clock:
+            return tomato.record.deadline
+        return super().next_change(tomato)
 
-        return self._format_time(self._remainder)
 
-    @property
-    def next_state(self):
-        return IntermediateState.transition_to(WorkingState, self._tomato)
+class SmallBreakState(RunningState):
+    __slots__ = ()
+    name = "small break"
+    task = Tasks.SMALL_BREAK
+    minutes = "small_break_minutes"
+    trigger = "small_break_state_cmd"
 
-    def pause(self):
-        return SmallBreakPausedState.return_to(self._tomato, self)
+    def next_state(self, tomato):
+        return WAITING.wait_for(tomato, WORKING)
 
-    def reset(self):
-        self._remainder = self.time_period
-        return self
+    def pause(self, tomato):
+        tomato.record.remainder = self._remaining(tomato)
+        return SMALL_BREAK_PAUSED
 
-    @property
-    def done(self):
-        return self._remainder <= 0
 
+class LongBreakState(SmallBreakState):
+    __slots__ = ()
+    name = "long break"
+    task = Tasks.LONG_BREAK
+    minutes = "long_break_minutes"
+    trigger = "long_break_state_cmd"
 
-class SmallBreakPausedState(InitialState):
-    name = "small break paused"
+    def pause(self, tomato):
+        tomato.record.remainder = self._remaining(tomato)
+        return LONG_BREAK_PAUSED
 
-    def __init__(self, tomato):
-        super().__init__(tomato)
-        self._task = Tasks.SMALL_BREAK
-        self._status = TaskStatus.PAUSED
-        self._prev = None
 
-    def start(self):
-        self._prev._started_at = cur_time()
-        return self._prev
+class PausedState(InitialState):
+    """
+    A period on hold, `running` is the state resumed by start
+    """
 
-    @property
-    def time_remaining(self):
-        return self._format_time(self._prev.remainder)
+    __slots__ = ()
+    status = TaskStatus.PAUSED
+    running = None
 
-    @staticmethod
-    def return_to(tomato, state):
-        cur_state = SmallBreakPausedState(tomato)
-        cur_state._prev = state
-        return cur_state
+    def start(self, tomato):
+        return self.running.resume(tomato)
 
-    def reset(self):
-        self._prev._remainder = self._prev.time_period
+    def reset(self, tomato):
+        tomato.record.remainder = tomato.record.time_period
         return self
 
-    @property
-    def done(self):
-        return False
+    def time_remaining(self, tomato):
+        return self._format_time(tomato, tomato.record.remainder)
 
 
-class LongBreakState(SmallBreakState):
-    name = "long break"
+class WorkPausedState(PausedState):
+    __slots__ = ()
+    name = "work paused"
+    task = Tasks.WORK
 
-    def __init__(self, tomato):
-        super().__init__(tomato)
-        self._time_period = self._remainder = int(
-            self._tomato.configs.long_break_minutes * SECONDS_PER_MIN
-        )
-        self._task = Tasks.LONG_BREAK
-        self._status = TaskStatus.STARTED
-        if self._tomato.configs.long_break_state_cmd:
-            subprocess.run(self._tomato.configs.long_break_state_cmd)
+    def start(self, tomato):
+        tomato.run_trigger("work_resumed_state_cmd")
+        return super().start(tomato)
 
-    def pause(self):
-        return LongBreakPausedState.return_to(self._tomato, self)
 
+class SmallBreakPausedState(PausedState):
+    __slots__ = ()
+    name = "small break paused"
+    task = Tasks.SMALL_BREAK
 
-class LongBreakPausedState(SmallBreakPausedState):
-    name = "long break paused"
-
-    def __init__(self, tomato):
-        super().__init__(tomato)
-        self._task = Tasks.LONG_BREAK
-        self._status = TaskStatus.PAUSED
 
-    @staticmethod
-    def return_to(tomato, state):
-        cur_state = LongBreakPausedState(tomato)
-        cur_state._prev = state
-        return cur_state
+class LongBreakPausedState(PausedState):
+    __slots__ = ()
+    name = "long break paused"
+    task = Tasks.LONG_BREAK
+
+
+INITIAL = InitialState()
+WAITING = IntermediateState()
+WORKING = WorkingState()
+SMALL_BREAK = SmallBreakState()
+LONG_BREAK = LongBreakState()
+WORK_PAUSED = WorkPausedState()
+SMALL_BREAK_PAUSED = SmallBreakPausedState()
+LONG_BREAK_PAUSED = LongBreakPausedState()
+
+WorkPausedState.running = WORKING
+SmallBreakPausedState.running = SMALL_BREAK
+LongBreakPausedState.running = LONG_BREAK
+
+STATES = {
+    state.name: state
+    for state in (
+        INITIAL,
+        WAITING,
+        WORKING,
+        SMALL_BREAK,
+        LONG_BREAK,
+        WORK_PAUSED,
+        SMALL_BREAK_PAUSED,
+        LONG_BREAK_PAUSED,
+    )
+}
 
 
 class Tomato:
-    def __init__(self, configs: Configuration):
+    __slots__ = (
+        "configs",
+        "clock",
+        "tomatoes",
+        "record",
+        "triggers",
+        "history",
+        "_state",
+        "_listeners",
+        "_hook",
+        "_frame",
+        "_slots",
+        "_rendered",
+        "_version",
+    )
+
+    def __init__(self, configs: Configuration, clock=None, name=None):
+        """
+        `name` keeps the history log of one of several timers apart
+        """
         self.configs = configs
-        self.reload_configs = False
+        self.clock = clock or RealClock(configs.clock)
         self.tomatoes = 0
-        self._state = InitialState(self)
+        self.record = TimerRecord()
+        # Created with the first trigger command that runs, unless shared
+        self.triggers = None
+        self._listeners = []
+        self._hook = None
+        # WHY None: built on first render, timers of the daemon never render
+        self._frame = None
+        self._slots = None
+        self._rendered = None
+        self._version = 0
+        self._start_hook()
+        if not configs.no_sound:
+            self._prepare_sound()
+        self.history = None
+        if configs.history:
+            from pydoro.pydoro_core.history import History
+
+            self.history = History(named_path(configs.history_file, name))
+            self.add_listener(self.history.record)
+        self._state = INITIAL
+
+    def add_listener(self, listener):
+        """
+        Call `listener(tomato)` after every state transition
+        """
+        self._listeners.append(listener)
+
+    def _start_hook(self):
+        if self.configs.hook_process_cmd:
+            self._hook = HookProcess(self.configs.hook_process_cmd)
+            self.add_listener(self._hook.notify)
+
+    def _set_state(self, state, changed=False):
+        if state is self._state and not changed:
+            return
+        self._state = state
+        for listener in self._listeners:
+            listener(self)
+
+    @property
+    def state_name(self):
+        return self._state.name
+
+    @property
+    def task(self):
+        return self._state.task
+
+    @property
+    def status(self):
+        return self._state.status
+
+    @property
+    def remaining(self):
+        """
+        Seconds left in the current (or paused) period
+        """
+        end = self._state.next_transition(self)
+        if end is None:
+            return self._state.remainder(self)
+        return max(end - self.clock.now(), 0) / NS_PER_SECOND
+
+    def describe(self):
+        """
+        Current state as a plain dict, for hooks and remote clients
+        """
+        return {
+            "state": self.state_name,
+            "task": self.task.name.lower(),
+            "status": self.status.name.lower(),
+            "remaining": self.remaining,
+            "tomatoes": self.tomatoes,
+            "sets": self.tomatoes // self.configs.tomatoes_per_set,
+        }
 
     def start(self):
-        self._state = self._state.start()
+        self._set_state(self._state.start(self))
 
     def pause(self):
-        self._state = self._state.pause()
+        self._set_state(self._state.pause(self))
 
     def reset(self):
-        self._state = self._state.reset()
+        self._set_state(self._state.reset(self), changed=True)
 
     def reset_all(self):
-        self._state = InitialState(self)
         self.tomatoes = 0
-
-    def edit_configs(self):
-        config_file_path = os.environ.get(
-            "PYDORO_CONFIG_FILE", os.path.expanduser("~/.config/pydoro/pydoro.ini")
+        self.record = TimerRecord()
+        self._set_state(INITIAL, changed=True)
+
+    def checkpoint(self):
+        """
+        Snapshot of the timer that `restore` can continue from, in any run
+        """
+        record = self.record
+        end = self._state.next_transition(self)
+        deadline = None
+        if end is not None:
+            # WHY wall clock: clock nanoseconds do not carry over a restart
+            deadline = time_ns() + end - self.clock.now()
+        return Snapshot(
+            self.state_name,
+            record.after.name if record.after is not None else None,
+            self.tomatoes,
+            record.remainder,
+            record.time_period,
+            deadline,
         )
-        open_file_in_default_editor(config_file_path)
-        # load config changes
-        self.configs = Configuration()
-        self._state = InitialState(self)
-        self.tomatoes = 0
-        get_app().reset()
+
+    def restore(self, snapshot):
+        """
+        Continue from `snapshot`, taken by `checkpoint`
+
+        Time passed since then counts, a period that ran out meanwhile ends
+        with the next update. No trigger command runs and listeners are not
+        called, the state was reported when it was first entered.
+        """
+        state = STATES[snapshot.state]
+        record = TimerRecord()
+        record.remainder = snapshot.remainder
+        record.time_period = snapshot.time_period
+        record.after = STATES.get(snapshot.after)
+        if snapshot.deadline is not None:
+            record.deadline = self.clock.now() + snapshot.deadline - time_ns()
+        elif isinstance(state, RunningState):
+            state = INITIAL
+        if state is WAITING and record.after is None:
+            state = INITIAL
+        self.tomatoes = snapshot.tomatoes
+        self.record = record
+        self._state = state
+        if self.history is not None and record.deadline is not None:
+            # WHY: time worked across the restart is counted in the history
+            self.history.resume(self)
+
+    def apply_configs(self, changed):
+        """
+        Follow the settings `Configuration.reload` reported as changed
+
+        The period in progress and the counters are kept, new durations
+        apply from the next period on.
+        """
+        if "hook_process_cmd" in changed:
+            if self._hook is not None:
+                self._listeners.remove(self._hook.notify)
+                self._hook.close(0)
+                self._hook = None
+            self._start_hook()
+        if changed & {"audio_file", "tone", "audio_sink", "no_sound"}:
+            if not self.configs.no_sound:
+                self._prepare_sound()
+
+    @property
+    def alarm_sound(self):
+        """
+        What play_alarm plays, a synthesized tone or the audio file
+        """
+        if self.configs.tone != "off":
+            return sound.TONE_PREFIX + self.configs.tone
+        return self.configs.audio_file
+
+    def _prepare_sound(self):
+        """
+        Pick the sink and render a tone alarm ahead of its first play, a
+        backend already in use also decodes the alarm file
+        """
+        # noinspection PyBroadException
+        try:
+            sound.use_sink(self.configs.audio_sink)
+            sound.preload(self.alarm_sound)
+        except Exception:
+            pass
 
     def update(self):
-        if self._state.done:
-            self._state = self._state.next_state
+        if self._state.done(self):
+            self._set_state(self._state.next_state(self))
+
+    def shutdown(self, timeout=None):
+        """
+        Wait for pending trigger commands, hook messages and history records
+        """
+        if self.triggers is not None:
+            self.triggers.join(timeout)
+        if self._hook is not None:
+            self._hook.close(timeout)
+        if self.history is not None:
+            self.history.close(timeout)
+
+    @property
+    def next_change(self):
+        return self._state.next_change(self)
+
+    @property
+    def next_transition(self):
+        return self._state.next_transition(self)
+
+    def run_trigger(self, event):
+        """
+        Run the `[Trigger]` command configured for `event` in the background
+        """
+        cmd = getattr(self.configs, event)
+        if cmd:
+            if self.triggers is None:
+                self.triggers = TriggerExecutor(
+                    self.configs.cmd_timeout_seconds, self.configs.max_concurrent_cmds
+                )
+            self.triggers.submit(event, cmd, self)
 
     def play_alarm(self):
         if self.configs.no_sound:
             return
         # noinspection PyBroadException
         try:
-            sound.play(self.configs.audio_file, block=False)
+            sound.alarm(self.alarm_sound)
         except Exception:
             pass
 
     def tomato_symbol(self):
-        ascii_tomato = "(`) "
-        if self.configs.emoji:
-            try:
-                "🍅".encode(sys.stdout.encoding)
-                return "🍅 "
-            except UnicodeEncodeError:
-                return ascii_tomato
-        return ascii_tomato
+        return _tomato_symbol(self.configs.emoji, sys.stdout.encoding)
 
-    def render(self) -> (list, int):
-        task = TEXT[self._state.task]
-        task = task.splitlines()
-        if not task:
-            task = [""] * 4
-
-        sets = self.tomatoes // self.configs.tomatoes_per_set
-        if sets == 1:
-            sets = "1 set completed"
-        elif sets >= 2:
-            sets = str(sets) + " sets completed"
-        else:
-            sets = ""
-
-        status = TEXT[self._state.status]
-        time = self._state.time_remaining
-        count = self.tomato_symbol() * (
-            self.configs.tomatoes_per_set - self.tomatoes % self.configs.tomatoes_per_set
-        )
-
-        ftext = TOMATO[:]
-        for i in range(0, 4):
-            ftext[LOCATIONS[PLACEHOLDER_TASK[i]]] = ("", task[i])
-        ftext[LOCATIONS[PLACEHOLDER_STATUS]] = ("", status)
-        ftext[LOCATIONS[PLACEHOLDER_TIME]] = ("", time)
-        ftext[LOCATIONS[PLACEHOLDER_COUNT]] = ("", count)
-        ftext[LOCATIONS[PLACEHOLDER_SETS]] = ("", sets)
+    def _set_slot(self, placeholder, value):
+        if self._slots.get(placeholder) != value:
+            self._slots[placeholder] = value
+            self._frame[LOCATIONS[placeholder]] = ("", value)
+            self._version += 1
 
-        hash_ = hash((status, time, count, sets) + tuple(task))
-
-        return ftext, hash_
+    def render(self) -> (list, int):
+        """
+        Fill the placeholders of the tomato art for the current state
+
+        The same fragment list is updated in place on every call, only the
+        slots whose inputs changed are recomputed. The returned version
+        number changes whenever any fragment did.
+        """
+        if self._frame is None:
+            self._frame = TOMATO[:]
+            self._slots = {}
+            self._rendered = {}
+        task = self._state.task
+        if self._rendered.get("task") != task:
+            self._rendered["task"] = task
+            for placeholder, line in zip(PLACEHOLDER_TASK, BANNERS[task]):
+                self._set_slot(placeholder, line)
+
+        status = self._state.status
+        if self._rendered.get("status") != status:
+            self._rendered["status"] = status
+            self._set_slot(PLACEHOLDER_STATUS, TEXT[status])
+
+        per_set = self.configs.tomatoes_per_set
+        counts = (self.tomatoes, per_set, self.configs.emoji)
+        if self._rendered.get("counts") != counts:
+            self._rendered["counts"] = counts
+            sets = self.tomatoes // per_set
+            if sets == 1:
+                sets = "1 set completed"
+            elif sets >= 2:
+                sets = str(sets) + " sets completed"
+            else:
+                sets = ""
+            self._set_slot(PLACEHOLDER_SETS, sets)
+            count = self.tomato_symbol() * (per_set - self.tomatoes % per_set)
+            self._set_slot(PLACEHOLDER_COUNT, count)
+
+        self._set_slot(PLACEHOLDER_TIME, self._state.time_remaining(self))
+
+        return self._frame, self._version
+
+
+@functools.lru_cache(maxsize=None)
+def _tomato_symbol(emoji, encoding):
+    ascii_tomato = "(`) "
+    if emoji:
+        try:
+            "🍅".encode(encoding)
+            return "🍅 "
+        except UnicodeEncodeError:
+            return ascii_tomato
+    return ascii_tomato
@@ -0,0 +1,110 @@
+"""
+Synthesized alarm tones
+
+A tone is a pattern of notes rendered once into 16-bit mono PCM and kept
+in memory as a complete WAV file, so playing it needs no file at all.
+Patterns are either one of the names in PATTERNS or a comma-separated
+list of `frequency/milliseconds` notes, a frequency of 0 being a rest:
+
+    tone = 880/120,0/80,880/120,0/80,880/120
+"""
+
+import array
+import functools
+import math
+import struct
+import sys
+
+RATE = 22050
+AMPLITUDE = 0.6 * 32767
+# Fade in and out of every note, keeps the speaker from clicking
+RAMP_SECONDS = 0.005
+# How fast a note dies away over its length, 0 holds it steady
+DECAY = 2.5
+
+PATTERNS = {
+    "beep": "880/120,0/80,880/120,0/80,880/120",
+    "chime": "1319/350,1047/650",
+    "bell": "660/1200",
+}
+
+# RIFF size, fmt chunk (PCM, channels, rate, byte rate, block align,
+# bits per sample), data size
+WAV_HEADER = struct.Struct("<4sI4s4sIHHIIHH4sI")
+
+
+def parse(pattern):
+    """
+    (frequency, seconds) notes of a pattern name or spec, ValueError if invalid
+    """
+    spec = PATTERNS.get(pattern.strip().lower(), pattern)
+    notes = []
+    for note in spec.split(","):
+        try:
+            frequency, milliseconds = note.split("/")
+            frequency, seconds = float(frequency), float(milliseconds) / 1000
+        except ValueError:
+            raise ValueError(
+                "expected {} or frequency/milliseconds notes such as "
+                "880/120,0/80,880/120, got {!r}".format(", ".join(PATTERNS), pattern)
+            ) from None
+        # WHY whole samples: a note shorter than one renders to nothing
+        if frequency < 0 or not 0 < seconds <= 10 or int(seconds * RATE) < 1:
+            raise ValueError("invalid note {!r} in {!r}".format(note, pattern))
+        notes.append((frequency, seconds))
+    return tuple(notes)
+
+
+def duration(pattern):
+    """
+    Seconds the tone plays for
+    """
+    return sum(seconds for _, seconds in parse(pattern))
+
+
+def _render(notes):
+    samples = array.array("h")
+    ramp = RAMP_SECONDS * RATE
+    for frequency, seconds in notes:
+        count = int(seconds * RATE)
+        if not frequency:
+            samples.frombytes(bytes(2 * count))
+            continue
+        step = 2 * math.pi * frequency / RATE
+        decay = DECAY / count
+        samples.extend(
+            int(
+                AMPLITUDE
+                * math.sin(step * i)
+                * min(1.0, i / ramp, (count - i) / ramp)
+                * math.exp(-decay * i)
+            )
+            for i in range(count)
+        )
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples.tobytes()
+
+
+@functools.lru_cache(maxsize=8)
+def wav(pattern):
+    """
+    The tone as the bytes of a WAV file, rendered on first use
+    """
+    pcm = _render(parse(pattern))
+    header = WAV_HEADER.pack(
+        b"RIFF",
+        WAV_HEADER.size - 8 + len(pcm),
+        b"WAVE",
+        b"fmt ",
+        16,
+        1,
+        1,
+        RATE,
+        RATE * 2,
+        2,
+        16,
+        b"data",
+        len(pcm),
+    )
+    return header + pcm
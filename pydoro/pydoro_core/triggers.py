@@ -0,0 +1,152 @@
+import collections
+import subprocess
+import threading
+from timeit import default_timer
+
+from pydoro.pydoro_core import metrics
+from pydoro.pydoro_core.clock import to_ns
+
+# How many finished trigger commands are remembered
+RESULTS_KEPT = 64
+
+
+class TriggerResult:
+    def __init__(self, event, cmd, returncode, duration, error=None):
+        self.event = event
+        self.cmd = cmd
+        # None if the command could not be started or timed out
+        self.returncode = returncode
+        self.duration = duration
+        self.error = error
+
+    def __repr__(self):
+        return "TriggerResult({!r}, returncode={!r}, duration={:.3f}s)".format(
+            self.event, self.returncode, self.duration
+        )
+
+    @property
+    def failed(self):
+        return self.returncode != 0
+
+    def describe(self):
+        """
+        The result as a plain dict, for remote clients
+        """
+        return {
+            "event": self.event,
+            "cmd": self.cmd,
+            "returncode": self.returncode,
+            "seconds": self.duration,
+            "error": str(self.error) if self.error is not None else None,
+        }
+
+
+class TriggerExecutor:
+    """
+    Runs `[Trigger]` commands in the background
+
+    Commands of the same event run one after another in submission order,
+    at most `max_concurrent` commands run at once over all events and each
+    one is killed after `timeout` seconds (None or <= 0 waits forever).
+    If an event already has `max_pending` commands queued, new ones are
+    dropped and counted in `dropped`.
+
+    Events of different `source`s, the timers sharing one executor, are
+    kept apart: each has its own order and its own queue.
+    """
+
+    def __init__(self, timeout=None, max_concurrent=2, max_pending=16):
+        self._timeout = timeout if timeout and timeout > 0 else None
+        self._max_concurrent = max(1, max_concurrent)
+        self._max_pending = max_pending
+        # Commands not started yet by (source, event), an event stays in
+        # here while one of its commands runs
+        self._queues = {}
+        # Events with commands waiting and none running, in turn order
+        self._ready = collections.deque()
+        self._started = False
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._idle = threading.Condition(self._lock)
+        self._unfinished = 0
+        self.dropped = 0
+        self.failed = 0
+        self.results = collections.deque(maxlen=RESULTS_KEPT)
+
+    def submit(self, event, cmd, source=None):
+        key = source, event
+        with self._lock:
+            event_queue = self._queues.get(key)
+            if event_queue is None:
+                event_queue = self._queues[key] = collections.deque()
+                self._ready.append(key)
+                self._wakeup.notify()
+            elif len(event_queue) >= self._max_pending:
+                self.dropped += 1
+                metrics.count("triggers_dropped")
+                return
+            event_queue.append(cmd)
+            self._unfinished += 1
+            if not self._started:
+                # WHY a fixed pool: threads do not grow with timers or events
+                for _ in range(self._max_concurrent):
+                    threading.Thread(target=self._run, daemon=True).start()
+                self._started = True
+
+    def join(self, timeout=None):
+        """
+        Wait until every submitted command has finished
+        Returns False if `timeout` expired first
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: self._unfinished == 0, timeout)
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                self._wakeup.wait_for(lambda: self._ready)
+                key = self._ready.popleft()
+                cmd = self._queues[key].popleft()
+            result = self._execute(key[1], cmd)
+            self.results.append(result)
+            metrics.record("trigger", to_ns(result.duration))
+            if result.failed:
+                metrics.count("triggers_failed")
+            with self._idle:
+                self.failed += result.failed
+                if self._queues[key]:
+                    self._ready.append(key)
+                    self._wakeup.notify()
+                else:
+                    del self._queues[key]
+                self._unfinished -= 1
+                self._idle.notify_all()
+
+    def _execute(self, event, cmd):
+        started = default_timer()
+        try:
+            returncode = subprocess.run(cmd, timeout=self._timeout).returncode
+            error = None
+        except subprocess.TimeoutExpired as e:
+            returncode, error = None, e
+        except (OSError, ValueError) as e:
+            returncode, error = None, e
+        return TriggerResult(event, cmd, returncode, default_timer() - started, error)
+
+
+def report(executors):
+    """
+    Commands failed and dropped by `executors` (None ones are skipped),
+    and the failures among the latest results
+    """
+    executors = [executor for executor in executors if executor is not None]
+    return {
+        "failed": sum(executor.failed for executor in executors),
+        "dropped": sum(executor.dropped for executor in executors),
+        "failures": [
+            result.describe()
+            for executor in executors
+            for result in list(executor.results)
+            if result.failed
+        ],
+    }
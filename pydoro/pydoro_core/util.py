@@ -1,32 +1,69 @@
+import functools
 import os
-import time
 import sys
 import subprocess
+import threading
 
+from pydoro.pydoro_core import metrics
+from pydoro.pydoro_core.clock import NS_PER_SECOND, RealClock
 
-def every(delay, task):
-    next_time = time.time() + delay
-    while True:
-        time.sleep(max(0, next_time - time.time()))
-        task()
-        next_time += (time.time() - next_time) // delay * delay + delay
 
+class Scheduler:
+    """
+    Call `task` whenever something visible can change
 
+    `task` returns the absolute `clock()` instant (in nanoseconds) of its
+    next deadline, or None if nothing will change until `wake()` is called.
+    No single wait is longer than `max_wait` nanoseconds, if given.
+    """
+
+    def __init__(self, task, clock=RealClock().now, max_wait=None):
+        self._task = task
+        self._clock = clock
+        self._max_wait = max_wait
+        self._wakeup = threading.Event()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def run(self):
+        while True:
+            # WHY: clear before running the task so a wake() issued while
+            # the task runs is not lost
+            self._wakeup.clear()
+            deadline = self._task()
+            if deadline is None:
+                self._wakeup.wait()
+            else:
+                timeout = max(0, deadline - self._clock())
+                if self._max_wait is not None and timeout > self._max_wait:
+                    self._wakeup.wait(self._max_wait / NS_PER_SECOND)
+                elif not self._wakeup.wait(timeout / NS_PER_SECOND):
+                    metrics.record("scheduler_lateness", self._clock() - deadline)
+
+
+@functools.lru_cache(maxsize=None)
 def in_app_path(path):
-    try:
-        wd = sys._MEIPASS
-        return os.path.abspath(os.path.join(wd, path))
-    except AttributeError:
-        return _from_resource(path)
+    """
+    Absolute path of a data file shipped with pydoro
+    Looked up in PyInstaller's bundle directory when frozen,
+    next to this module otherwise.
+    """
+    base = getattr(sys, "_MEIPASS", None)
+    if base is None:
+        base = os.path.dirname(os.path.abspath(__file__))
+    return os.path.abspath(os.path.join(base, path))
 
 
-def _from_resource(path):
-    from pkg_resources import resource_filename
+def named_path(path, name):
+    """
+    `path` with `-name` added before its extension, `path` if `name` is None
+    """
+    if name is None:
+        return path
+    base, ext = os.path.splitext(path)
+    return "{}-{}{}".format(base, name, ext)
 
-    res_path = resource_filename(__name__, path)
-    if not os.path.exists(res_path):
-        res_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
-    return res_path
 
 def open_file_in_default_editor(file_path):
     '''Opens config file in another process using default editor'''
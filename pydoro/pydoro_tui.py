@@ -1,15 +1,11 @@
 #!/usr/bin/env python
 
-__version__ = "0.2.3"
-
-import sys
-import os
 import threading
 import subprocess
 
-from prompt_toolkit.application import Application
+from prompt_toolkit.application import Application, run_in_terminal
 from prompt_toolkit.application.current import get_app
-from prompt_toolkit.key_binding import KeyBindings
+from prompt_toolkit.key_binding import DynamicKeyBindings, KeyBindings
 from prompt_toolkit.key_binding.bindings.focus import focus_next, focus_previous
 from prompt_toolkit.layout import (
     HSplit,
@@ -23,37 +19,119 @@ from prompt_toolkit.filters import Condition
 from prompt_toolkit.styles import Style
 from prompt_toolkit.widgets import Box, Button, Label
 
+from pydoro import __version__  # noqa: F401
+from pydoro.pydoro_core import control, metrics, sound, triggers
+from pydoro.pydoro_core.clock import RealClock, perf_counter_ns
 from pydoro.pydoro_core.config import Configuration
+from pydoro.pydoro_core.filewatch import FileWatcher
+from pydoro.pydoro_core.snapshot import FLUSH_SECONDS, Checkpointer
+from pydoro.pydoro_core.status import StatusWriter
 from pydoro.pydoro_core.tomato import Tomato
-from pydoro.pydoro_core.util import every, in_app_path
-import pydoro.pydoro_core.sound as sound
+from pydoro.pydoro_core.util import (
+    Scheduler,
+    named_path,
+    open_file_in_default_editor,
+)
+
+
+class TimerPane:
+    """
+    One timer of the TUI and the window it is drawn in
+    """
+
+    def __init__(self, name, tomato, is_selected):
+        self.name = name
+        self.tomato = tomato
+        self.prev_version = None
+        self.text_area = FormattedTextControl(focusable=False, show_cursor=False)
+        text_window = Window(
+            content=self.text_area,
+            dont_extend_height=True,
+            height=11,
+            style="bg:#ffffff #000000",
+        )
+        if name is None:
+            self.container = text_window
+            return
+
+        def title():
+            style = "class:pane-title.selected" if is_selected(self) else ""
+            return [(style, " {} ".format(name))]
+
+        self.container = HSplit(
+            [
+                Window(FormattedTextControl(title), height=1, style="class:pane-title"),
+                text_window,
+            ]
+        )
+
+    def draw(self):
+        """
+        Bring the pane up to date, True if its text changed
+        """
+        self.tomato.update()
+        text, version = self.tomato.render()
+        # WHY: Avoid unnecessary updates
+        if version == self.prev_version:
+            return False
+        self.text_area.text = text
+        self.prev_version = version
+        return True
 
 
 class UserInterface:
     def __init__(self, configs: Configuration):
         self.configs = configs
-        self.tomato = Tomato(self.configs)
-        self.prev_hash = None
+        # WHY one clock and one scheduler: timers added do not add threads
+        clock = RealClock(self.configs.clock)
+        self._checkpointers = []
+        self.panes = [
+            TimerPane(name, self._create_tomato(name, clock), self._is_selected)
+            for name in self.configs.timers or [None]
+        ]
+        self.selected = 0
+        self._scheduler = Scheduler(self._draw, clock.now, clock.max_wait)
+        self._status = StatusWriter() if self.configs.status_file else None
 
-        self.helpwindow = HelpContainer(self.configs._conf["KeyBindings"])
+        self.helpwindow = HelpContainer(
+            self.configs.key_bindings, timers=len(self.panes) > 1
+        )
 
         self._create_ui()
 
+    def _create_tomato(self, name, clock):
+        tomato = Tomato(self.configs, clock, name)
+        if self.configs.resume:
+            checkpointer = Checkpointer(named_path(self.configs.state_file, name))
+            checkpointer.attach(tomato)
+            self._checkpointers.append(checkpointer)
+        return tomato
+
+    @property
+    def tomato(self):
+        """
+        Timer of the selected pane, the one buttons and keys act on
+        """
+        return self.panes[self.selected].tomato
+
+    def _is_selected(self, pane):
+        return self.panes[self.selected] is pane
+
+    def _select(self, index):
+        if 0 <= index < len(self.panes):
+            self.selected = index
+            self.application.invalidate()
+            self._scheduler.wake()
+
     def _create_ui(self):
-        btn_start = Button("Start", handler=self.tomato.start)
-        btn_pause = Button("Pause", handler=self.tomato.pause)
-        btn_reset = Button("Reset", handler=self.tomato.reset)
-        btn_reset_all = Button("Reset All", handler=self.tomato.reset_all)
-        btn_edit_configs = Button("Configs", handler=self.tomato.edit_configs)
+        btn_start = Button("Start", handler=self._redraw_after("start"))
+        btn_pause = Button("Pause", handler=self._redraw_after("pause"))
+        btn_reset = Button("Reset", handler=self._redraw_after("reset"))
+        btn_reset_all = Button("Reset All", handler=self._redraw_after("reset_all"))
+        btn_edit_configs = Button("Configs", handler=self._edit_configs)
         btn_exit = Button("Exit", handler=self._exit_clicked)
         # All the widgets for the UI.
-        self.text_area = FormattedTextControl(focusable=False, show_cursor=False)
-        text_window = Window(
-            content=self.text_area,
-            dont_extend_height=True,
-            height=11,
-            style="bg:#ffffff #000000",
-        )
+        text_window = VSplit([pane.container for pane in self.panes], padding=2)
         root_container = Box(
             HSplit(
                 [
@@ -93,11 +171,17 @@ class UserInterface:
                 ("button focused", "bg:#ff0000"),
                 ("red", "#ff0000"),
                 ("green", "#00ff00"),
+                ("pane-title", "bold"),
+                ("pane-title.selected", "reverse"),
             ]
         )
 
+        # WHY dynamic: key bindings are replaced when the config file changes
         self.application = Application(
-            layout=layout, key_bindings=self.kb, style=style, full_screen=True
+            layout=layout,
+            key_bindings=DynamicKeyBindings(lambda: self.kb),
+            style=style,
+            full_screen=True,
         )
 
     def _set_key_bindings(self):
@@ -107,11 +191,17 @@ class UserInterface:
             "focus_next": focus_next,
             "focus_previous": focus_previous,
             "exit_clicked": self._exit_clicked,
-            "start": lambda _=None: self.tomato.start(),
-            "pause": lambda _=None: self.tomato.pause(),
-            "reset": lambda _=None: self.tomato.reset(),
-            "reset_all": lambda _=None: self.tomato.reset_all(),
+            "start": self._redraw_after("start"),
+            "pause": self._redraw_after("pause"),
+            "reset": self._redraw_after("reset"),
+            "reset_all": self._redraw_after("reset_all"),
             "help": lambda _=None: self.toggle_help_window_state(),
+            "next_timer": lambda _=None: self._select(
+                (self.selected + 1) % len(self.panes)
+            ),
+            "previous_timer": lambda _=None: self._select(
+                (self.selected - 1) % len(self.panes)
+            ),
         }
 
         for action, keys in self.configs.key_bindings.items():
@@ -120,11 +210,55 @@ class UserInterface:
                     self.kb.add(key.strip())(actions[action])
                 except KeyError:
                     pass
+        if len(self.panes) > 1:
+            for index in range(min(len(self.panes), 9)):
+                self.kb.add(str(index + 1))(
+                    lambda _, index=index: self._select(index)
+                )
+
+    def _redraw_after(self, action):
+        """
+        Handler running the tomato `action` on the selected timer, the
+        scheduler redraws as soon as it is done
+        """
+
+        def handler(_=None):
+            getattr(self.tomato, action)()
+            self._scheduler.wake()
+
+        return handler
 
     @staticmethod
     def _exit_clicked(_=None):
         get_app().exit()
 
+    def _edit_configs(self):
+        """
+        Hand the terminal to the editor, the timer keeps running meanwhile
+        """
+        editing = run_in_terminal(
+            lambda: open_file_in_default_editor(self.configs.config_file),
+            in_executor=True,
+        )
+        editing.add_done_callback(lambda _: self._reload_configs())
+
+    def _config_file_changed(self):
+        # WHY: called from the watcher thread, reload on the event loop
+        loop = self.application.loop
+        if loop is not None:
+            loop.call_soon_threadsafe(self._reload_configs)
+
+    def _reload_configs(self):
+        changed = self.configs.reload()
+        if not changed:
+            return
+        for pane in self.panes:
+            pane.tomato.apply_configs(changed)
+        if "key_bindings" in changed:
+            self._set_key_bindings()
+            self.helpwindow.keybindings = self.configs.key_bindings
+        self._scheduler.wake()
+
     def toggle_help_window_state(self):
         if self.helpwindow.is_visible():
             self.helpwindow.hide()
@@ -132,37 +266,114 @@ class UserInterface:
             self.helpwindow.show()
 
     def _draw(self):
-        self.tomato.update()
-        text, hash_ = self.tomato.render()
-        # WHY: Avoid unnecessary updates
-        if hash_ != self.prev_hash:
-            self.text_area.text = text
+        """
+        Update every pane whose text changed, returns the instant the
+        soonest of them can change again
+        """
+        started = perf_counter_ns()
+        changed = [pane.draw() for pane in self.panes]
+        metrics.record("render", perf_counter_ns() - started)
+        if any(changed):
             self.application.invalidate()
-            self.prev_hash = hash_
+            metrics.count("frames_emitted")
+        else:
+            metrics.count("frames_suppressed")
+        if self._status is not None:
+            self._status.publish(self.tomato)
+        changes = [pane.tomato.next_change for pane in self.panes]
+        return min((change for change in changes if change is not None), default=None)
+
+    def _control(self, line):
+        """
+        Answer a command received on the control socket
+
+        A timer name after the command picks one of several timers, the
+        selected one is used without.
+        """
+        command, _, name = line.partition(" ")
+        if command == "metrics":
+            return dict(
+                metrics.report(),
+                alarms=sound.alarm_stats(),
+                triggers=triggers.report(pane.tomato.triggers for pane in self.panes),
+            )
+        if command == "status" and not name and len(self.panes) > 1:
+            return {"timers": [self._describe(pane) for pane in self.panes]}
+        pane = self.panes[self.selected]
+        if name:
+            pane = self._pane(name.strip())
+        if command in ("start", "pause", "reset", "reset_all"):
+            getattr(pane.tomato, command)()
+            self._scheduler.wake()
+        elif command != "status":
+            raise ValueError("unknown command: " + command)
+        return self._describe(pane)
+
+    def _pane(self, name):
+        for pane in self.panes:
+            if pane.name == name:
+                return pane
+        raise ValueError("no such timer: " + name)
+
+    @staticmethod
+    def _describe(pane):
+        if pane.name is None:
+            return pane.tomato.describe()
+        return dict(pane.tomato.describe(), timer=pane.name)
+
+    def shutdown(self, timeout=None):
+        """
+        Wait for the hooks and snapshots of every timer
+        """
+        for pane in self.panes:
+            pane.tomato.shutdown(timeout)
+        for checkpointer in self._checkpointers:
+            checkpointer.flush(FLUSH_SECONDS)
+
+    def _pre_run(self):
+        FileWatcher(self.configs.config_file, self._config_file_changed).start()
+        if self.configs.control_socket and control.supported():
+            self.application.create_background_task(control.serve(self._control))
 
     def run(self):
         self._draw()
-        threading.Thread(target=lambda: every(0.4, self._draw), daemon=True).start()
-        self.application.run()
+        threading.Thread(target=self._scheduler.run, daemon=True).start()
+        self.application.run(pre_run=self._pre_run)
+        if self._status is not None:
+            self._status.close()
 
 
 class HelpContainer(ConditionalContainer):
-    def __init__(self, keybindings={}):
+    def __init__(self, keybindings={}, timers=False):
         self.visible = False
+        # Replaced on config reload, the labels read it whenever drawn
+        self.keybindings = keybindings
+
+        def keys(title, action):
+            return lambda: f"{title:<14}| {self.keybindings.get(action, '')}"
 
         content = Box(
             HSplit(
                 [
                     Label(text=f"----------------Help------------------\n"),
-                    Label(text=f"start         | {keybindings['start']}"),
-                    Label(text=f"pause         | {keybindings['pause']}"),
-                    Label(text=f"reset         | {keybindings['reset']}"),
-                    Label(text=f"reset all     | {keybindings['reset_all']}"),
-                    Label(text=f"help          | {keybindings['help']}"),
-                    Label(text=f"focus prev    | {keybindings['focus_previous']}"),
-                    Label(text=f"focus next    | {keybindings['focus_next']}"),
-                    Label(text=f"exit          | {keybindings['exit_clicked']}"),
+                    Label(text=keys("start", "start")),
+                    Label(text=keys("pause", "pause")),
+                    Label(text=keys("reset", "reset")),
+                    Label(text=keys("reset all", "reset_all")),
+                    Label(text=keys("help", "help")),
+                    Label(text=keys("focus prev", "focus_previous")),
+                    Label(text=keys("focus next", "focus_next")),
+                    Label(text=keys("exit", "exit_clicked")),
                 ]
+                + (
+                    [
+                        Label(text=keys("next timer", "next_timer")),
+                        Label(text=keys("prev timer", "previous_timer")),
+                        Label(text=f"{'timer 1-9':<14}| 1-9"),
+                    ]
+                    if timers
+                    else []
+                )
             )
         )
 
@@ -182,20 +393,20 @@ class HelpContainer(ConditionalContainer):
         self.visible = False
 
 
-def main():
-    configs = Configuration()
-    if configs.audio_check:
-        # WHY twice: to catch more issues
-        sound.play(in_app_path("b15.wav"), block=True)
-        sound.play(in_app_path("b15.wav"), block=True)
-        sys.exit(0)
-    if configs.show_version:
-        print("pydoro : version - {0}".format(__version__))
-        sys.exit(0)
-    UserInterface(configs).run()
+def run(configs: Configuration):
+    ui = UserInterface(configs)
+    ui.run()
+    # WHY: let hooks of the last transitions finish before exiting
+    ui.shutdown(configs.cmd_timeout_seconds or None)
     if configs.exit_cmd:
         subprocess.run(configs.exit_cmd)
 
 
+def main():
+    from pydoro.cli import main as cli_main
+
+    cli_main()
+
+
 if __name__ == "__main__":
     main()
@@ -29,6 +29,7 @@ setup(
             "pyobjc-framework-Cocoa>=5.2",
         ],
         'audio:platform_system=="Linux"': ["pycairo>=1.18.1", "PyGObject>=3.32.1"],
+        "stats": ["numpy"],
     },
     classifiers=[
         "Development Status :: 3 - Alpha",
@@ -40,6 +41,6 @@ setup(
     ],
     keywords="tomato pomodoro pydoro timer work",
     packages=find_packages(),
-    entry_points={"console_scripts": ["pydoro = pydoro.pydoro_tui:main"]},
+    entry_points={"console_scripts": ["pydoro = pydoro.cli:main"]},
     setup_requires=["wheel"],
 )
@@ -0,0 +1,14 @@
+import pytest
+
+from pydoro.pydoro_core import config
+
+
+@pytest.fixture
+def configs(tmp_path, monkeypatch):
+    """
+    Default settings read from a config file of their own, the developer's
+    config file and settings cache are left alone
+    """
+    monkeypatch.setenv("PYDORO_CONFIG_FILE", str(tmp_path / "pydoro.ini"))
+    monkeypatch.setattr(config, "CACHE_FILE", str(tmp_path / "cache.json"))
+    return config.Configuration([])
@@ -0,0 +1,86 @@
+import datetime
+
+import pytest
+
+from pydoro.pydoro_core import analytics
+from pydoro.pydoro_core.history import (
+    FLAG_SMALL_BREAK_DONE,
+    FLAG_WORK_DONE,
+    STATE_CODES,
+    Entry,
+    History,
+)
+
+WORK = STATE_CODES["work"]
+WORK_PAUSED = STATE_CODES["work paused"]
+WAITING = STATE_CODES["waiting"]
+INITIAL = STATE_CODES["initial"]
+SMALL_BREAK = STATE_CODES["small break"]
+FIRST_DAY = datetime.date(2024, 3, 4)
+
+
+def _day(history, day, hour):
+    """
+    A tomato with a reset and one pause, a resumed launch repeating the
+    paused state, then a break that overruns
+    """
+    t = datetime.datetime.combine(day, datetime.time(hour)).timestamp()
+    for offset, state, flags in (
+        (0, WORK, 0),
+        (60, WORK, 0),
+        (600, WORK_PAUSED, 0),
+        (700, WORK_PAUSED, 0),
+        (900, WORK, 0),
+        (2400, WAITING, FLAG_WORK_DONE),
+        (2460, SMALL_BREAK, 0),
+        (2760, WAITING, FLAG_SMALL_BREAK_DONE),
+        (2900, INITIAL, 0),
+    ):
+        history.append(Entry(t + offset, state, 1, flags, 1500.0, 0))
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / "history.bin")
+    history = History(path)
+    for offset in range(6):
+        _day(history, FIRST_DAY + datetime.timedelta(days=offset), 8 + offset)
+    # Fold the first days into summary records, read by both paths too
+    history.compact(FIRST_DAY + datetime.timedelta(days=2))
+    history.close()
+    return path
+
+
+def _stats(path, use_numpy):
+    columns = analytics.load_columns([path], use_numpy)
+    now = datetime.datetime.combine(
+        FIRST_DAY + datetime.timedelta(days=6), datetime.time(12)
+    ).timestamp()
+    return analytics.compute(columns, now)
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_statistics(path, use_numpy):
+    if use_numpy:
+        pytest.importorskip("numpy")
+    stats = _stats(path, use_numpy)
+    # Two folded days of a work and a small break summary each
+    assert stats.records == 2 * 2 + 4 * 9
+    assert stats.tomatoes == 6
+    assert stats.focus_minutes == pytest.approx(6 * 35)
+    assert stats.active_days == 6
+    assert stats.current_streak == 6
+    # Days left as they were: one period each despite the reset and the
+    # repeated pause
+    assert stats.work_periods == 4
+    assert stats.pauses == 4
+    assert stats.breaks == 4
+    assert stats.break_overrun == pytest.approx(140)
+
+
+def test_numpy_and_array_agree(path):
+    pytest.importorskip("numpy")
+    expected = _stats(path, use_numpy=False)
+    stats = _stats(path, use_numpy=True)
+    for field in analytics.Stats._fields:
+        assert getattr(stats, field) == pytest.approx(getattr(expected, field)), field
@@ -0,0 +1,69 @@
+import os
+
+import pytest
+
+from pydoro.pydoro_core import config
+
+
+def _edit(path, old, new):
+    """
+    Replace `old` by `new` in the file at `path`, moving its modification
+    time on so that the change is seen even within the same tick
+    """
+    with open(path) as f:
+        text = f.read()
+    assert old in text
+    with open(path, "w") as f:
+        f.write(text.replace(old, new))
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def test_every_bad_value_is_reported(configs):
+    _edit(configs.config_file, "work_minutes = 25", "work_minutes = -1")
+    _edit(configs.config_file, "alarm_backoff = 2", "alarm_backoff = fast")
+    _edit(configs.config_file, "alarm_seconds = 20", "alarm_seconds = nan")
+    with pytest.raises(config.ConfigError) as raised:
+        config.Configuration([])
+    errors = raised.value.errors
+    assert len(errors) == 3
+    for key in ("work_minutes", "alarm_backoff", "alarm_seconds"):
+        assert any(key in error for error in errors)
+        assert key in str(raised.value)
+
+
+def test_cache_is_reused_until_the_file_changes(configs, monkeypatch):
+    compiled = []
+    compile_ = config._compile
+
+    def counting_compile(path):
+        compiled.append(path)
+        return compile_(path)
+
+    monkeypatch.setattr(config, "_compile", counting_compile)
+    assert config.Configuration([]).work_minutes == 25
+    assert compiled == []
+
+    _edit(configs.config_file, "work_minutes = 25", "work_minutes = 30")
+    assert config.Configuration([]).work_minutes == 30
+    assert compiled == [configs.config_file]
+    # Cached again for the new file
+    assert config.Configuration([]).work_minutes == 30
+    assert len(compiled) == 1
+
+
+def test_reload_keeps_settings_of_a_bad_file(configs):
+    _edit(configs.config_file, "work_minutes = 25", "work_minutes = soon")
+    assert configs.reload() == set()
+    assert configs.work_minutes == 25
+
+    _edit(configs.config_file, "work_minutes = soon", "work_minutes = 20")
+    assert configs.reload() == {"work_minutes"}
+    assert configs.work_minutes == 20
+
+
+def test_reload_keeps_restart_settings(configs):
+    _edit(configs.config_file, "cmd_timeout_seconds = 30", "cmd_timeout_seconds = 5")
+    _edit(configs.config_file, "small_break_minutes = 5", "small_break_minutes = 7")
+    assert configs.reload() == {"small_break_minutes"}
+    assert configs.cmd_timeout_seconds == 30
@@ -0,0 +1,137 @@
+import datetime
+import os
+
+import pytest
+
+from pydoro.pydoro_core.history import (
+    FLAG_WORK_DONE,
+    RECORD_SIZE,
+    STATE_CODES,
+    TASK_WORK,
+    Entry,
+    History,
+    Totals,
+)
+
+FIRST_DAY = datetime.date(2024, 3, 4)
+DAYS = 5
+
+
+def _work_day(day):
+    """
+    Entries of two 25 minute tomatoes worked on `day`
+    """
+    start = datetime.datetime.combine(day, datetime.time(9)).timestamp()
+    entries = []
+    for tomato in range(2):
+        begin = start + tomato * 1800
+        entries.append(Entry(begin, STATE_CODES["work"], TASK_WORK, 0, 1500.0, tomato))
+        entries.append(
+            Entry(begin + 1500, STATE_CODES["waiting"], 5, FLAG_WORK_DONE, 0.0, tomato)
+        )
+    return entries
+
+
+def _totals(history):
+    return history.totals(FIRST_DAY, FIRST_DAY + datetime.timedelta(days=DAYS))
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / "history.bin")
+    history = History(path)
+    for offset in range(DAYS):
+        for entry in _work_day(FIRST_DAY + datetime.timedelta(days=offset)):
+            history.append(entry)
+    history.close()
+    return path
+
+
+EXPECTED = Totals(2 * DAYS, 0, 0, 2 * DAYS * 1500.0)
+
+
+def test_append_then_reopen(path):
+    history = History(path)
+    try:
+        assert history.size == 4 * DAYS
+        assert len(list(history.records())) == 4 * DAYS
+        assert _totals(history) == EXPECTED
+        assert history.totals(FIRST_DAY, FIRST_DAY) == Totals(2, 0, 0, 3000.0)
+    finally:
+        history.close()
+
+
+@pytest.mark.parametrize("damage", ["delete", "truncate"])
+def test_index_is_rebuilt(path, damage):
+    index_path = path + ".idx"
+    if damage == "delete":
+        os.remove(index_path)
+    else:
+        with open(index_path, "r+b") as f:
+            f.truncate(os.path.getsize(index_path) - 3)
+    history = History(path)
+    try:
+        assert _totals(history) == EXPECTED
+    finally:
+        history.close()
+
+
+def test_index_catches_up_with_the_log(path):
+    with open(path + ".idx", "rb") as f:
+        index = f.read()
+    extra = _work_day(FIRST_DAY + datetime.timedelta(days=DAYS))
+    history = History(path)
+    for entry in extra:
+        history.append(entry)
+    history.close()
+    # An index from before the last records were appended
+    with open(path + ".idx", "wb") as f:
+        f.write(index)
+    history = History(path)
+    try:
+        assert _totals(history) == Totals(2 * DAYS + 2, 0, 0, (2 * DAYS + 2) * 1500.0)
+    finally:
+        history.close()
+
+
+def test_torn_record_is_dropped(path):
+    with open(path, "ab") as f:
+        f.write(b"\x01" * (RECORD_SIZE // 2))
+    history = History(path)
+    try:
+        assert os.path.getsize(path) == 4 * DAYS * RECORD_SIZE
+        assert _totals(history) == EXPECTED
+    finally:
+        history.close()
+
+
+def test_corrupt_record_is_skipped(path):
+    os.remove(path + ".idx")
+    # Flip a byte of the last record, the waiting one completing a tomato
+    with open(path, "r+b") as f:
+        f.seek(-RECORD_SIZE, os.SEEK_END)
+        first = f.read(1)
+        f.seek(-RECORD_SIZE, os.SEEK_END)
+        f.write(bytes([first[0] ^ 0xFF]))
+    history = History(path)
+    try:
+        assert len(list(history.records())) == 4 * DAYS - 1
+        assert _totals(history) == Totals(2 * DAYS - 1, 0, 0, (2 * DAYS - 1) * 1500.0)
+    finally:
+        history.close()
+
+
+def test_compact_keeps_totals(path):
+    history = History(path)
+    try:
+        history.compact(FIRST_DAY + datetime.timedelta(days=DAYS - 1))
+        # Four days folded into one work summary each, the last one kept
+        assert history.size == (DAYS - 1) + 4
+        assert _totals(history) == EXPECTED
+    finally:
+        history.close()
+    history = History(path)
+    try:
+        assert _totals(history) == EXPECTED
+    finally:
+        history.close()
@@ -0,0 +1,13 @@
+import pytest
+
+from pydoro.pydoro_core.simulation import Simulation
+
+
+@pytest.mark.parametrize("pauses", [0, 3])
+def test_periods_end_on_time(configs, pauses):
+    simulation = Simulation(configs, pauses=pauses, pause_seconds=60, start_delay=5)
+    simulation.run(1000)
+    assert simulation.tomato.tomatoes == 1000
+    # Every running period, breaks included, is paused and resumed
+    assert simulation.transitions > 2 * 1000 * (2 * pauses + 1)
+    assert simulation.drift == 0